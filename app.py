@@ -3,23 +3,49 @@
 import os
 import uuid
 import qrcode
+import zlib
 import csv
 import random
 import string
-from io import StringIO, BytesIO
+import gzip
+import hashlib
+import json
+import time
+import bisect
+import threading
+import cProfile
+import pstats
+import numpy as np
+from io import StringIO, BytesIO, TextIOWrapper
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 from flask import (
-    Flask, render_template, request, redirect,
-    url_for, flash, send_file, current_app
+    Flask, render_template, request, redirect, has_request_context,
+    url_for, flash, current_app, session,
+    Response, stream_with_context, jsonify, abort, g
 )
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, cast, Integer, inspect, text, select, tuple_, bindparam, event, literal_column
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, joinedload, contains_eager, validates, make_transient_to_detached
 from flask_bcrypt import Bcrypt
 from flask_login import (
     LoginManager, UserMixin, login_user,
     login_required, logout_user, current_user
 )
 from werkzeug.utils import secure_filename
+from werkzeug.security import generate_password_hash, check_password_hash
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    import fcntl
+except ImportError:  # Windows: the dev server is a single process anyway
+    fcntl = None
 
 # ========================
 # EXTENSIONS
@@ -39,6 +65,110 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 def ist_now():
     return datetime.utcnow() + timedelta(hours=5, minutes=30)
 
+def new_uuid():
+    return str(uuid.uuid4())
+
+def parse_coordinates(lat, lon):
+    """
+    Form/JSON latitude and longitude as floats, or None where blank.
+    Raises ValueError for values that aren't numbers or are out of range.
+    """
+    lat = float(lat) if lat not in (None, '') else None
+    lon = float(lon) if lon not in (None, '') else None
+    if lat is not None and not -90 <= lat <= 90:
+        raise ValueError(f"latitude {lat} out of range")
+    if lon is not None and not -180 <= lon <= 180:
+        raise ValueError(f"longitude {lon} out of range")
+    return lat, lon
+
+class LRUCache:
+    """Small thread-safe in-memory LRU; maxsize 0 disables it."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# ========================
+# PASSWORDS
+# ========================
+# Hashes use PASSWORD_HASH_ALGORITHM (bcrypt at BCRYPT_LOG_ROUNDS, or
+# werkzeug's pbkdf2:sha256 at PBKDF2_ITERATIONS). Both release the GIL, so
+# hashing runs on a small per-process pool: at most PASSWORD_HASH_WORKERS
+# cores go to logins while the worker's other threads keep serving. Stored
+# hashes made with other settings still verify and are replaced on the
+# user's next successful login.
+
+_password_executor = None
+_password_executor_pid = None
+_password_executor_lock = threading.Lock()
+
+def password_executor():
+    """Hashing pool, recreated after a fork since threads don't survive one."""
+    global _password_executor, _password_executor_pid
+    with _password_executor_lock:
+        if _password_executor is None or _password_executor_pid != os.getpid():
+            _password_executor = ThreadPoolExecutor(
+                max_workers=current_app.config['PASSWORD_HASH_WORKERS'],
+                thread_name_prefix='password-hash'
+            )
+            _password_executor_pid = os.getpid()
+        return _password_executor
+
+def _hash(password, algorithm, cost):
+    if algorithm == 'pbkdf2':
+        return generate_password_hash(password, method=f"pbkdf2:sha256:{cost}")
+    return bcrypt.generate_password_hash(password, cost).decode('utf-8')
+
+def _verify(pw_hash, password):
+    if pw_hash.startswith('$2'):
+        return bcrypt.check_password_hash(pw_hash, password)
+    return check_password_hash(pw_hash, password)
+
+def _hash_settings():
+    cfg = current_app.config
+    if cfg['PASSWORD_HASH_ALGORITHM'] == 'pbkdf2':
+        return 'pbkdf2', cfg['PBKDF2_ITERATIONS']
+    return 'bcrypt', cfg['BCRYPT_LOG_ROUNDS']
+
+def hash_password(password):
+    return password_executor().submit(_hash, password, *_hash_settings()).result()
+
+def verify_password(pw_hash, password):
+    if not pw_hash or password is None:
+        return False
+    return password_executor().submit(_verify, pw_hash, password).result()
+
+def password_needs_rehash(pw_hash):
+    """True when a stored hash was made with a different algorithm or cost."""
+    algorithm, cost = _hash_settings()
+    if pw_hash.startswith('$2'):
+        # $2b$<rounds>$<salt+hash>
+        return algorithm != 'bcrypt' or int(pw_hash.split('$')[2]) != cost
+    # pbkdf2:sha256:<iterations>$<salt>$<hash>
+    method = pw_hash.split('$', 1)[0].split(':')
+    return algorithm != 'pbkdf2' or method[:2] != ['pbkdf2', 'sha256'] or method[2:] != [str(cost)]
+
 # ========================
 # MODELS
 # ========================
@@ -57,10 +187,14 @@ class Site(db.Model):
     name = db.Column(db.String(140), nullable=False)
     code = db.Column(db.String(20), nullable=False, unique=True)
     description = db.Column(db.Text)
+    # Row version, bumped in SQL by every UPDATE; page ETags are built from it
+    version = db.Column(db.Integer, default=1, onupdate=literal_column('version + 1'))
 
 class Carcass(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    code = db.Column(db.String(4), unique=True, nullable=False)
+    code = db.Column(db.String(8), unique=True, nullable=False)
+    # Client-generated for offline sync; unique via ix_carcass_uuid
+    uuid = db.Column(db.String(36), default=new_uuid)
 
     site_id = db.Column(db.Integer, db.ForeignKey('site.id'))
     reporter_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -71,16 +205,29 @@ class Carcass(db.Model):
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
     notes = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=ist_now, onupdate=ist_now)
+    version = db.Column(db.Integer, default=1, onupdate=literal_column('version + 1'))
 
     site = db.relationship('Site')
     reporter = db.relationship('User')
     samples = db.relationship('Sample', backref='carcass', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_carcass_site_datetime', 'site_id', 'datetime_found'),
+        db.Index('ix_carcass_datetime_found', 'datetime_found'),
+        db.Index('ix_carcass_species', 'species'),
+        db.Index('ix_carcass_animal_type', 'animal_type'),
+        db.Index('ix_carcass_lat_lng', 'latitude', 'longitude'),
+        db.Index('ix_carcass_uuid', 'uuid', unique=True),
+        db.Index('ix_carcass_updated_at', 'updated_at', 'id'),
+    )
+
 class Sample(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     carcass_id = db.Column(db.Integer, db.ForeignKey('carcass.id'))
     uuid = db.Column(db.String(36), nullable=False, unique=True)
     label = db.Column(db.String(120), nullable=False, unique=True)
+    label_suffix = db.Column(db.String(4))
     sample_type = db.Column(db.String(60))
     collected_by = db.Column(db.String(120))
     collected_at = db.Column(db.DateTime, default=ist_now)
@@ -91,24 +238,118 @@ class Sample(db.Model):
     # --- NEW COLUMNS FOR RESULTS ---
     status = db.Column(db.String(50), default='Pending')
     processing_result = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=ist_now, onupdate=ist_now)
+    version = db.Column(db.Integer, default=1, onupdate=literal_column('version + 1'))
+
+    __table_args__ = (
+        db.Index('ix_sample_carcass_id', 'carcass_id'),
+        db.Index('ix_sample_type_collected', 'sample_type', 'collected_at'),
+        db.Index('ix_sample_collected_at', 'collected_at', 'id'),
+        db.Index('ix_sample_label_suffix', 'label_suffix'),
+        db.Index('ix_sample_updated_at', 'updated_at', 'id'),
+    )
+
+    @validates('label')
+    def _set_label_suffix(self, key, label):
+        # Keep the random 4-char tail of the label searchable by index
+        self.label_suffix = label.rsplit('-', 1)[-1].upper() if label else None
+        return label
+
+class LabelSequence(db.Model):
+    # Last label sequence number issued per site and collection day
+    site_code = db.Column(db.String(20), primary_key=True)
+    date_str = db.Column(db.String(8), primary_key=True)
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+
+class CarcassCodePool(db.Model):
+    # Pre-shuffled unused carcass codes; a code is claimed by deleting its row
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(8), nullable=False, unique=True)
+    width = db.Column(db.Integer, nullable=False)
+
+class StatCounter(db.Model):
+    # Running totals for the admin dashboard, e.g. 'carcasses' or 'species:Tiger'
+    key = db.Column(db.String(200), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class EncounterRollup(db.Model):
+    # Carcass counts per time bucket, e.g. ('month', '2025-01-01', 'species', 'Tiger')
+    period = db.Column(db.String(5), primary_key=True)
+    bucket = db.Column(db.String(10), primary_key=True)
+    dimension = db.Column(db.String(20), primary_key=True)
+    member = db.Column(db.String(200), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_rollup_series', 'period', 'dimension', 'bucket'),
+    )
+
+class CarcassSnap(db.Model):
+    # Where a carcass lies along its site's road. No FK on carcass_id so
+    # deleting a carcass never waits on this cache; stale rows are pruned
+    # by refresh_site_hotspots().
+    carcass_id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, nullable=False)
+    segment = db.Column(db.Integer, nullable=False)
+    chainage_m = db.Column(db.Float, nullable=False)
+    offset_m = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_carcass_snap_site_segment', 'site_id', 'segment'),
+    )
+
+class RoadSegmentStat(db.Model):
+    # Ranked hotspot test result per fixed-length segment of a site's road
+    site_id = db.Column(db.Integer, primary_key=True)
+    segment = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    window_count = db.Column(db.Integer, nullable=False)
+    expected = db.Column(db.Float, nullable=False)
+    p_value = db.Column(db.Float, nullable=False)
+    is_hotspot = db.Column(db.Boolean, nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+
+class RoadHotspotRun(db.Model):
+    # What the cached segment stats of a site were computed from
+    site_id = db.Column(db.Integer, primary_key=True)
+    geometry_hash = db.Column(db.String(64), nullable=False)
+    watermark = db.Column(db.DateTime)
+    carcass_count = db.Column(db.Integer, nullable=False, default=0)
+    computed_at = db.Column(db.DateTime, default=ist_now)
+
+class SchemaMigration(db.Model):
+    # One row per data migration that has been applied (see migrate_database)
+    name = db.Column(db.String(120), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=ist_now)
 
 @login_manager.user_loader
 def load_user(user_id):
     try:
-        return User.query.get(int(user_id))
-    except Exception:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
         return None
 
+    values = user_cache.get(user_id)
+    if values is not None:
+        # Rebuild the row as a detached instance and attach it without a SELECT
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        user_cache.set(user)
+    return user
+
 # ========================
 # DB INIT
 # ========================
 
 def init_db():
     if not User.query.filter_by(username="admin").first():
-        hashed = bcrypt.generate_password_hash("admin").decode("utf-8")
         admin = User(
             username="admin",
-            pw_hash=hashed,
+            pw_hash=hash_password("admin"),
             full_name="Administrator",
             role="admin",
             is_approved=True
@@ -116,26 +357,865 @@ def init_db():
         db.session.add(admin)
         db.session.commit()
 
+# Data migrations run once each, in registration order, after the schema
+# has been brought up to date. Register with @data_migration("name").
+DATA_MIGRATIONS = []
+
+def data_migration(name):
+    def decorator(fn):
+        DATA_MIGRATIONS.append((name, fn))
+        return fn
+    return decorator
+
+def keep_onupdate(table):
+    """
+    UPDATE values that leave table's onupdate columns (updated_at, version)
+    as they are. Backfills aren't edits: bumping them would make every row
+    look changed at the same instant to sync clients and page caches.
+    """
+    return {c.name: c for c in table.columns if c.onupdate is not None}
+
+def migrate_database():
+    """
+    Brings an existing database up to the current models: adds missing
+    columns (backfilling scalar defaults), creates missing indexes and runs
+    pending data migrations. Idempotent, and portable across SQLite and
+    Postgres because all DDL is compiled by SQLAlchemy for the live dialect.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            added = [c for c in table.columns if c.name not in existing]
+            for column in added:
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {col_type}"))
+            # Backfill only once every column exists, since the UPDATE
+            # names the onupdate columns such as updated_at
+            for column in added:
+                if column.default is not None and column.default.is_scalar:
+                    conn.execute(
+                        table.update()
+                        .where(column.is_(None))
+                        .values({**keep_onupdate(table), column.name: column.default.arg})
+                    )
+
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+    applied = {m.name for m in SchemaMigration.query.all()}
+    for name, fn in DATA_MIGRATIONS:
+        if name in applied:
+            continue
+        fn()
+        db.session.add(SchemaMigration(name=name))
+        db.session.commit()
+
+@data_migration("backfill_sample_label_suffix")
+def backfill_sample_label_suffix():
+    tail = func.substr(Sample.label, func.length(Sample.label) - 3, 4)
+    Sample.query.filter(Sample.label_suffix.is_(None)).update(
+        {**keep_onupdate(Sample.__table__), 'label_suffix': func.upper(tail)}, synchronize_session=False
+    )
+
+@data_migration("backfill_sync_columns")
+def backfill_sync_columns():
+    for model, found in ((Carcass, Carcass.datetime_found), (Sample, Sample.collected_at)):
+        model.query.filter(model.updated_at.is_(None)).update(
+            {**keep_onupdate(model.__table__), 'updated_at': func.coalesce(found, ist_now())}, synchronize_session=False
+        )
+    missing = [r[0] for r in db.session.query(Carcass.id).filter(Carcass.uuid.is_(None))]
+    if missing:
+        db.session.execute(
+            Carcass.__table__.update()
+            .where(Carcass.__table__.c.id == bindparam('cid'))
+            .values({**keep_onupdate(Carcass.__table__), 'uuid': bindparam('new_uuid')}),
+            [{'cid': cid, 'new_uuid': new_uuid()} for cid in missing]
+        )
+
+@data_migration("widen_carcass_code")
+def widen_carcass_code():
+    # SQLite ignores VARCHAR lengths; Postgres enforces them
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text("ALTER TABLE carcass ALTER COLUMN code TYPE VARCHAR(8)"))
+
 def setup_database(app):
     with app.app_context():
         db.create_all()
+        migrate_database()
         init_db()
 
+# ========================
+# FULL-TEXT SEARCH
+# ========================
+# Samples are indexed together with their carcass's species and notes:
+# an FTS5 table (rowid = sample.id) on SQLite, a weighted tsvector with a
+# GIN index on Postgres. The index is refreshed from the flushed rows by
+# an after_flush hook, so every create/edit path keeps it current.
+
+SEARCH_FIELDS = {
+    'sample': ('notes', 'processing_result', 'storage'),
+    'carcass': ('species', 'notes'),
+}
+
+PG_SEARCH_DOCUMENT = """
+    setweight(to_tsvector('english', coalesce(c.species, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(s.notes, '') || ' ' || coalesce(c.notes, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(s.processing_result, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(s.storage, '')), 'C')
+"""
+
+def search_index_refresh(conn, where, **params):
+    """(Re)indexes the samples selected by a WHERE clause over sample s / carcass c."""
+    expanding = [bindparam(k, expanding=True) for k, v in params.items() if isinstance(v, (list, tuple))]
+    if conn.dialect.name == 'postgresql':
+        stmt = text(f"""
+            INSERT INTO sample_search (sample_id, document)
+            SELECT s.id, {PG_SEARCH_DOCUMENT}
+            FROM sample s LEFT JOIN carcass c ON c.id = s.carcass_id
+            WHERE {where}
+            ON CONFLICT (sample_id) DO UPDATE SET document = EXCLUDED.document
+        """)
+        conn.execute(stmt.bindparams(*expanding), params)
+        return
+
+    conn.execute(text(f"""
+        DELETE FROM sample_fts WHERE rowid IN (
+            SELECT s.id FROM sample s LEFT JOIN carcass c ON c.id = s.carcass_id WHERE {where}
+        )
+    """).bindparams(*expanding), params)
+    conn.execute(text(f"""
+        INSERT INTO sample_fts (rowid, species, notes, processing_result, storage, carcass_notes)
+        SELECT s.id, c.species, s.notes, s.processing_result, s.storage, c.notes
+        FROM sample s LEFT JOIN carcass c ON c.id = s.carcass_id
+        WHERE {where}
+    """).bindparams(*expanding), params)
+
+def search_index_remove(conn, sample_ids):
+    table, key = ('sample_search', 'sample_id') if conn.dialect.name == 'postgresql' else ('sample_fts', 'rowid')
+    conn.execute(
+        text(f"DELETE FROM {table} WHERE {key} IN :ids").bindparams(bindparam('ids', expanding=True)),
+        {'ids': list(sample_ids)}
+    )
+
+@data_migration("create_search_index")
+def create_search_index():
+    conn = db.session.connection()
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS sample_search (
+                sample_id INTEGER PRIMARY KEY REFERENCES sample (id) ON DELETE CASCADE,
+                document TSVECTOR NOT NULL
+            )
+        """))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_sample_search_document ON sample_search USING GIN (document)"))
+    else:
+        conn.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS sample_fts USING fts5(
+                species, notes, processing_result, storage, carcass_notes,
+                tokenize = 'porter unicode61'
+            )
+        """))
+    search_index_refresh(conn, "1 = 1")
+
+_search_index_ready = False
+
+def search_index_ready(conn):
+    global _search_index_ready
+    if not _search_index_ready:
+        table = 'sample_search' if conn.dialect.name == 'postgresql' else 'sample_fts'
+        _search_index_ready = inspect(conn).has_table(table)
+    return _search_index_ready
+
+def _changed(obj, fields):
+    state = inspect(obj)
+    return any(state.attrs[f].history.has_changes() for f in fields)
+
+@event.listens_for(Session, 'after_flush')
+def update_search_index(session, flush_context):
+    sample_ids, carcass_ids, removed = set(), set(), set()
+    for obj in session.new:
+        if isinstance(obj, Sample):
+            sample_ids.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Sample) and _changed(obj, SEARCH_FIELDS['sample']):
+            sample_ids.add(obj.id)
+        elif isinstance(obj, Carcass) and _changed(obj, SEARCH_FIELDS['carcass']):
+            carcass_ids.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Sample):
+            removed.add(obj.id)
+
+    if not (sample_ids or carcass_ids or removed):
+        return
+    conn = session.connection()
+    if not search_index_ready(conn):
+        return  # not built yet; create_search_index backfills these rows
+
+    if sample_ids:
+        search_index_refresh(conn, "s.id IN :sample_ids", sample_ids=list(sample_ids))
+    if carcass_ids:
+        search_index_refresh(conn, "s.carcass_id IN :carcass_ids", carcass_ids=list(carcass_ids))
+    if removed:
+        search_index_remove(conn, removed)
+
+def fts_query(q):
+    # Quote every term so user input can't hit FTS5 syntax; match prefixes
+    terms = [t.replace('"', '""') for t in q.split()]
+    return ' '.join(f'"{t}"*' for t in terms)
+
+def search_samples(q, limit):
+    """Best-ranked samples matching the words in q, with carcass loaded."""
+    if not q.strip():
+        return []
+    conn = db.session.connection()
+    if conn.dialect.name == 'postgresql':
+        rows = conn.execute(text("""
+            SELECT sample_id FROM sample_search, plainto_tsquery('english', :q) query
+            WHERE document @@ query
+            ORDER BY ts_rank(document, query) DESC
+            LIMIT :limit
+        """), {'q': q, 'limit': limit})
+    else:
+        rows = conn.execute(text("""
+            SELECT rowid FROM sample_fts WHERE sample_fts MATCH :q
+            ORDER BY bm25(sample_fts, 4.0, 2.0, 2.0, 1.0, 2.0)
+            LIMIT :limit
+        """), {'q': fts_query(q), 'limit': limit})
+    ids = [r[0] for r in rows]
+    if not ids:
+        return []
+
+    by_id = {
+        s.id: s for s in
+        Sample.query.options(joinedload(Sample.carcass)).filter(Sample.id.in_(ids))
+    }
+    return [by_id[i] for i in ids if i in by_id]
+
+# ========================
+# STATISTICS
+# ========================
+# Dashboard counters are kept in stat_counter and adjusted in the same
+# transaction as the write that changes them (after_flush below).
+# refresh_statistics() rebuilds them from scratch for bulk SQL updates
+# that bypass the ORM; run it from refresh_stats.py on a schedule.
+
+def carcass_stat_keys(site_id, species, found):
+    keys = ['carcasses']
+    if site_id is not None:
+        keys.append(f"site:{site_id}")
+    if species:
+        keys.append(f"species:{species}")
+    if found:
+        keys.append(f"month:{found.strftime('%Y-%m')}")
+    return keys
+
+def _old_value(obj, attr):
+    hist = inspect(obj).attrs[attr].history
+    return hist.deleted[0] if hist.deleted else getattr(obj, attr)
+
+_ready_tables = set()
+
+def table_ready(conn, name):
+    # Counter hooks can fire before migrate_database() has created their table
+    if name not in _ready_tables and inspect(conn).has_table(name):
+        _ready_tables.add(name)
+    return name in _ready_tables
+
+def bump_counters(conn, table, deltas, column='value'):
+    """
+    Adds deltas, keyed by primary-key tuples, to a counter table with one
+    upsert statement.
+    """
+    pk = [c.name for c in table.primary_key.columns]
+    params = [dict(zip(pk, key), **{column: d}) for key, d in deltas.items() if d]
+    if not params:
+        return
+    ins = (pg_insert if conn.dialect.name == 'postgresql' else sqlite_insert)(table)
+    conn.execute(
+        ins.on_conflict_do_update(index_elements=pk, set_={column: table.c[column] + ins.excluded[column]}),
+        params
+    )
+
+@event.listens_for(Session, 'after_flush')
+def update_statistics(session, flush_context):
+    deltas = {}
+
+    def add(keys, d):
+        for k in keys:
+            deltas[k] = deltas.get(k, 0) + d
+
+    for objs, sign in ((session.new, 1), (session.deleted, -1)):
+        for obj in objs:
+            if isinstance(obj, User):
+                add(['users'], sign)
+                if not obj.is_approved:
+                    add(['users_pending'], sign)
+            elif isinstance(obj, Site):
+                add(['sites'], sign)
+            elif isinstance(obj, Carcass):
+                add(carcass_stat_keys(obj.site_id, obj.species, obj.datetime_found), sign)
+                if obj.code:
+                    # Codes never change, so only inserts and deletes move these
+                    add([f"code_width:{len(obj.code)}"], sign)
+            elif isinstance(obj, Sample):
+                add(['samples'], sign)
+
+    for obj in session.dirty:
+        if isinstance(obj, User) and _changed(obj, ('is_approved',)):
+            add(['users_pending'], 1 if not obj.is_approved else -1)
+        elif isinstance(obj, Carcass) and _changed(obj, ('site_id', 'species', 'datetime_found')):
+            add(carcass_stat_keys(
+                _old_value(obj, 'site_id'), _old_value(obj, 'species'), _old_value(obj, 'datetime_found')
+            ), -1)
+            add(carcass_stat_keys(obj.site_id, obj.species, obj.datetime_found), 1)
+
+    if any(deltas.values()) and table_ready(session.connection(), 'stat_counter'):
+        bump_counters(session.connection(), StatCounter.__table__, {(k,): d for k, d in deltas.items()})
+
+def refresh_statistics():
+    """Recomputes every counter with a handful of GROUP BY queries."""
+    counts = {
+        'users': User.query.count(),
+        'users_pending': User.query.filter(User.is_approved.isnot(True)).count(),
+        'sites': Site.query.count(),
+        'carcasses': Carcass.query.count(),
+        'samples': Sample.query.count(),
+    }
+    for site_id, n in db.session.query(Carcass.site_id, func.count()).filter(Carcass.site_id.isnot(None)).group_by(Carcass.site_id):
+        counts[f"site:{site_id}"] = n
+    for species, n in db.session.query(Carcass.species, func.count()).filter(Carcass.species.isnot(None)).group_by(Carcass.species):
+        counts[f"species:{species}"] = n
+    for width, n in db.session.query(func.length(Carcass.code), func.count()).filter(Carcass.code.isnot(None)).group_by(func.length(Carcass.code)):
+        counts[f"code_width:{width}"] = n
+    # Month buckets are folded in Python so the SQL stays dialect-neutral
+    for found, in db.session.query(Carcass.datetime_found).filter(Carcass.datetime_found.isnot(None)):
+        key = f"month:{found.strftime('%Y-%m')}"
+        counts[key] = counts.get(key, 0) + 1
+
+    db.session.execute(StatCounter.__table__.delete())
+    db.session.execute(StatCounter.__table__.insert(), [{'key': k, 'value': v} for k, v in counts.items()])
+    db.session.commit()
+
+@data_migration("build_statistics")
+def build_statistics():
+    refresh_statistics()
+
+@data_migration("build_code_width_counters")
+def build_code_width_counters():
+    refresh_statistics()
+
+def read_statistics():
+    """All counters in one read, split into totals and breakdowns."""
+    stats = {'totals': {}, 'site': {}, 'species': {}, 'month': {}, 'code_width': {}}
+    for key, value in db.session.query(StatCounter.key, StatCounter.value):
+        kind, sep, name = key.partition(':')
+        if sep:
+            if value:
+                stats[kind][name] = value
+        else:
+            stats['totals'][kind] = value
+    return stats
+
+# ========================
+# ANALYTICS
+# ========================
+# encounter_rollup holds carcass counts per day/week/month bucket, overall
+# and per site, species, animal_type and encounter_type, plus per-month
+# counts of HOTSPOT_CELL_DEG grid cells for the heat layer. Like the
+# dashboard counters they are adjusted on every flush and can be rebuilt
+# with refresh_rollups().
+
+ROLLUP_PERIODS = ('day', 'week', 'month')
+ROLLUP_DIMENSIONS = ('all', 'site', 'species', 'animal_type', 'encounter_type')
+ROLLUP_FIELDS = ('site_id', 'species', 'animal_type', 'encounter_type', 'datetime_found', 'latitude', 'longitude')
+HOTSPOT_CELL_DEG = 0.01  # ~1 km; the finest resolution the heat layer can show
+
+def period_start(found, period):
+    day = found.date()
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+def hotspot_cell(lat, lng):
+    return f"{int((float(lat) + 90) // HOTSPOT_CELL_DEG)}:{int((float(lng) + 180) // HOTSPOT_CELL_DEG)}"
+
+def rollup_keys(values):
+    """encounter_rollup primary keys a carcass with these field values counts towards."""
+    found = values['datetime_found']
+    if not found:
+        return []
+    members = [('all', '')]
+    for dim in ROLLUP_DIMENSIONS[1:]:
+        member = values['site_id' if dim == 'site' else dim]
+        if member not in (None, ''):
+            members.append((dim, str(member)))
+
+    keys = []
+    for period in ROLLUP_PERIODS:
+        bucket = period_start(found, period).isoformat()
+        keys.extend((period, bucket, dim, member) for dim, member in members)
+    if values['latitude'] is not None and values['longitude'] is not None:
+        month = period_start(found, 'month').isoformat()
+        keys.append(('month', month, 'cell', hotspot_cell(values['latitude'], values['longitude'])))
+    return keys
+
+@event.listens_for(Session, 'after_flush')
+def update_rollups(session, flush_context):
+    deltas = {}
+
+    def add(values, d):
+        for key in rollup_keys(values):
+            deltas[key] = deltas.get(key, 0) + d
+
+    for objs, sign in ((session.new, 1), (session.deleted, -1)):
+        for obj in objs:
+            if isinstance(obj, Carcass):
+                add({f: getattr(obj, f) for f in ROLLUP_FIELDS}, sign)
+
+    for obj in session.dirty:
+        if isinstance(obj, Carcass) and _changed(obj, ROLLUP_FIELDS):
+            add({f: _old_value(obj, f) for f in ROLLUP_FIELDS}, -1)
+            add({f: getattr(obj, f) for f in ROLLUP_FIELDS}, 1)
+
+    if any(deltas.values()) and table_ready(session.connection(), 'encounter_rollup'):
+        bump_counters(session.connection(), EncounterRollup.__table__, deltas, column='total')
+
+def refresh_rollups(batch_size=1000):
+    """Recomputes encounter_rollup from the carcass table."""
+    counts = {}
+    columns = [getattr(Carcass, f) for f in ROLLUP_FIELDS]
+    for row in db.session.query(*columns).filter(Carcass.datetime_found.isnot(None)).yield_per(batch_size):
+        for key in rollup_keys(row._asdict()):
+            counts[key] = counts.get(key, 0) + 1
+
+    table = EncounterRollup.__table__
+    rows = [dict(period=p, bucket=b, dimension=d, member=m, total=n) for (p, b, d, m), n in counts.items()]
+    db.session.execute(table.delete())
+    for i in range(0, len(rows), batch_size):
+        db.session.execute(table.insert(), rows[i:i + batch_size])
+    db.session.commit()
+
+@data_migration("build_encounter_rollups")
+def build_encounter_rollups():
+    refresh_rollups()
+
+def encounter_series(period, dimension, start=None, end=None):
+    """
+    {member: [(bucket, count), ...]} for one period and dimension, with
+    buckets in order. start/end are ISO dates matched against bucket starts.
+    """
+    query = db.session.query(EncounterRollup.member, EncounterRollup.bucket, EncounterRollup.total).filter(
+        EncounterRollup.period == period,
+        EncounterRollup.dimension == dimension,
+        EncounterRollup.total > 0
+    )
+    if start:
+        query = query.filter(EncounterRollup.bucket >= start)
+    if end:
+        query = query.filter(EncounterRollup.bucket <= end)
+
+    series = {}
+    for member, bucket, total in query.order_by(EncounterRollup.bucket):
+        series.setdefault(member, []).append((bucket, total))
+    return series
+
+def hotspot_points(args):
+    """
+    (lat, lng, count) arrays at HOTSPOT_CELL_DEG resolution. Unfiltered
+    requests read the cell rollups; anything the rollups can't answer
+    (site, species, type, code or date filters) is grouped in SQL instead.
+    """
+    filters = ('site', 'animal_type', 'species', 'code', 'date_from', 'date_to')
+    if not any(args.get(f) not in (None, '', 'all') for f in filters):
+        rows = db.session.query(EncounterRollup.member, func.sum(EncounterRollup.total)).filter(
+            EncounterRollup.period == 'month',
+            EncounterRollup.dimension == 'cell'
+        ).group_by(EncounterRollup.member).having(func.sum(EncounterRollup.total) > 0).all()
+        cells = np.array([m.split(':') for m, _ in rows], dtype=float).reshape(-1, 2)
+        lat = (cells[:, 0] + 0.5) * HOTSPOT_CELL_DEG - 90
+        lng = (cells[:, 1] + 0.5) * HOTSPOT_CELL_DEG - 180
+        counts = np.array([n for _, n in rows], dtype=float)
+
+        bbox = parse_bbox(args.get('bbox'))
+        if bbox:
+            west, south, east, north = bbox
+            inside = (lat >= south) & (lat <= north) & (lng >= west) & (lng <= east)
+            lat, lng, counts = lat[inside], lng[inside], counts[inside]
+        return lat, lng, counts
+
+    cy = grid_cell(Carcass.latitude, -90, HOTSPOT_CELL_DEG)
+    cx = grid_cell(Carcass.longitude, -180, HOTSPOT_CELL_DEG)
+    query = db.session.query(
+        func.avg(Carcass.latitude), func.avg(Carcass.longitude), func.count(Carcass.id)
+    ).outerjoin(Site, Carcass.site_id == Site.id)
+    rows = filter_map_carcasses(query, args).group_by(cy, cx).all()
+    data = np.array(rows, dtype=float).reshape(-1, 3)
+    return data[:, 0], data[:, 1], data[:, 2]
+
+def kernel_density(lat, lng, counts, size, bandwidth, max_cells):
+    """
+    Bins points into a size-degree grid and smooths it with a separable
+    Gaussian kernel of `bandwidth` cells. The grid only spans the occupied
+    extent (plus the kernel radius) and is coarsened until it fits in
+    max_cells. Returns (south, west, size, density grid).
+    """
+    radius = max(1, int(np.ceil(3 * bandwidth)))
+    while True:
+        iy = np.floor((lat + 90) / size).astype(np.int64)
+        ix = np.floor((lng + 180) / size).astype(np.int64)
+        y0, x0 = iy.min() - radius, ix.min() - radius
+        shape = (iy.max() - y0 + radius + 1, ix.max() - x0 + radius + 1)
+        if shape[0] * shape[1] <= max_cells:
+            break
+        size *= 2
+
+    grid = np.zeros(shape)
+    np.add.at(grid, (iy - y0, ix - x0), counts)
+
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    kernel /= kernel.sum()
+    grid = np.apply_along_axis(np.convolve, 0, grid, kernel, mode='same')
+    grid = np.apply_along_axis(np.convolve, 1, grid, kernel, mode='same')
+
+    return y0 * size - 90, x0 * size - 180, size, grid
+
+# ========================
+# ROAD HOTSPOTS
+# ========================
+# Each site's road comes from the GeoJSON file at ROAD_GEOMETRY_PATH: a
+# FeatureCollection of LineString/MultiLineString features whose `site`
+# (or OSM `ref`) property matches Site.code. Carcasses are snapped to the
+# nearest point on their site's road and bucketed into HOTSPOT_SEGMENT_M
+# segments. Following Malo et al. (2004), a window of HOTSPOT_WINDOW
+# segments centred on a segment is a hotspot when its count is improbably
+# high (p < HOTSPOT_ALPHA) for a Poisson process at the road's mean rate.
+# Results are cached in road_segment_stat and brought up to date by
+# refresh_stats.py (run it from cron); requests only read the cache.
+
+EARTH_RADIUS_M = 6371008.8
+
+class SiteRoad:
+    """A site's road as straight edges in a local equirectangular projection (metres)."""
+
+    def __init__(self, lines):
+        lines = [np.asarray(line, dtype=float)[:, :2] for line in lines if len(line) >= 2]
+        self.a_ll = np.concatenate([line[:-1] for line in lines])
+        self.b_ll = np.concatenate([line[1:] for line in lines])
+        self.lat0 = np.radians(self.a_ll[:, 1].mean())
+        self.a = self.project(self.a_ll)
+        self.b = self.project(self.b_ll)
+        self.length = np.hypot(*(self.b - self.a).T)
+        self.chainage = np.concatenate([[0.0], np.cumsum(self.length)[:-1]])
+        self.total_m = float(self.length.sum())
+        self.digest = hashlib.sha1(np.concatenate([self.a_ll, self.b_ll]).tobytes()).hexdigest()
+
+    def project(self, lnglat):
+        rad = np.radians(lnglat)
+        return np.column_stack([rad[:, 0] * np.cos(self.lat0), rad[:, 1]]) * EARTH_RADIUS_M
+
+    def snap(self, lnglat):
+        """(chainage, offset) in metres of each point's nearest position on the road."""
+        p = self.project(np.asarray(lnglat, dtype=float).reshape(-1, 2))
+        d = self.b - self.a
+        dd = np.maximum((d ** 2).sum(axis=1), 1e-9)
+        chainage, offset = np.empty(len(p)), np.empty(len(p))
+
+        # Points x edges distance matrices, in blocks of ~2M cells
+        step = max(1, 2000000 // len(d))
+        for i in range(0, len(p), step):
+            rel = p[i:i + step, None, :] - self.a[None, :, :]
+            t = np.clip((rel * d).sum(axis=2) / dd, 0.0, 1.0)
+            dist = np.hypot(*(rel - t[..., None] * d).transpose(2, 0, 1))
+            nearest = dist.argmin(axis=1)
+            rows = np.arange(len(nearest))
+            chainage[i:i + step] = self.chainage[nearest] + t[rows, nearest] * self.length[nearest]
+            offset[i:i + step] = dist[rows, nearest]
+        return chainage, offset
+
+    def slice(self, start_m, end_m):
+        """MultiLineString coordinates of the road between two chainages."""
+        hit = np.nonzero((self.chainage < end_m) & (self.chainage + self.length > start_m))[0]
+        lines, prev = [], None
+        for e in hit:
+            span = max(self.length[e], 1e-9)
+            t0 = max(0.0, (start_m - self.chainage[e]) / span)
+            t1 = min(1.0, (end_m - self.chainage[e]) / span)
+            step = self.b_ll[e] - self.a_ll[e]
+            if prev is None or prev != e - 1 or not np.allclose(self.b_ll[prev], self.a_ll[e]):
+                lines.append([self.a_ll[e] + t0 * step])
+            lines[-1].append(self.a_ll[e] + t1 * step)
+            prev = e
+        return [[[round(float(x), 6), round(float(y), 6)] for x, y in line] for line in lines]
+
+_road_network = {'key': None, 'roads': {}}
+
+def road_network():
+    """{SITE CODE: SiteRoad} from ROAD_GEOMETRY_PATH, reloaded when the file changes."""
+    path = current_app.config['ROAD_GEOMETRY_PATH']
+    try:
+        key = (path, os.path.getmtime(path))
+    except OSError:
+        return {}
+
+    if _road_network['key'] != key:
+        with open(path, encoding='utf-8') as fh:
+            features = json.load(fh).get('features', [])
+        lines = {}
+        for feature in features:
+            props = feature.get('properties') or {}
+            geometry = feature.get('geometry') or {}
+            code = props.get('site') or props.get('ref')
+            if not code:
+                continue
+            if geometry.get('type') == 'LineString':
+                parts = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiLineString':
+                parts = geometry['coordinates']
+            else:
+                continue
+            lines.setdefault(str(code).strip().upper(), []).extend(parts)
+        _road_network['roads'] = {code: SiteRoad(parts) for code, parts in lines.items()}
+        _road_network['key'] = key
+    return _road_network['roads']
+
+def poisson_sf(k, mu):
+    """P(X >= k) for X ~ Poisson(mu), elementwise over integer k and mu > 0."""
+    k = np.asarray(k, dtype=np.int64)
+    mu = np.asarray(mu, dtype=float)
+    n = max(int(k.max()), 1)
+    j = np.arange(n)
+    log_fact = np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, n)))])
+    cdf = np.cumsum(np.exp(j * np.log(mu)[:, None] - mu[:, None] - log_fact), axis=1)
+    below = np.where(k > 0, cdf[np.arange(k.size), np.maximum(k - 1, 0)], 0.0)
+    return np.clip(1.0 - below, 0.0, 1.0)
+
+def segment_hotspot_test(counts, window, alpha):
+    """
+    Sliding-window Poisson test over per-segment counts. Returns window
+    counts, expected counts, p-values, hotspot flags and ranks (1 = worst).
+    """
+    n = len(counts)
+    kernel = np.ones(max(1, min(window, n)))
+    window_counts = np.rint(np.convolve(counts, kernel, mode='same')).astype(np.int64)
+    # Windows are clipped at the ends of the road, so expectation follows their width
+    expected = counts.sum() / n * np.convolve(np.ones(n), kernel, mode='same')
+    p_values = poisson_sf(window_counts, expected) if counts.sum() else np.ones(n)
+    hotspot = (p_values < alpha) & (counts > 0)
+
+    rank = np.empty(n, dtype=np.int64)
+    rank[np.lexsort((p_values, -window_counts))] = np.arange(1, n + 1)
+    return window_counts, expected, p_values, hotspot, rank
+
+def refresh_site_hotspots(site, road):
+    """
+    Brings the cached segment stats of one site up to date. Only carcasses
+    changed since the last run are snapped, unless the road geometry or
+    segment settings changed. Returns False when the cache was current.
+    """
+    cfg = current_app.config
+    segment_m = cfg['HOTSPOT_SEGMENT_M']
+    geometry_hash = hashlib.sha1(f"{road.digest}:{segment_m}:{cfg['HOTSPOT_SNAP_M']}".encode()).hexdigest()
+
+    located = Carcass.query.filter(
+        Carcass.site_id == site.id, Carcass.latitude.isnot(None), Carcass.longitude.isnot(None)
+    )
+    watermark, carcass_count = located.with_entities(func.max(Carcass.updated_at), func.count(Carcass.id)).one()
+    run = db.session.get(RoadHotspotRun, site.id)
+    full = run is None or run.geometry_hash != geometry_hash
+    if not full and run.watermark == watermark and run.carcass_count == carcass_count:
+        return False
+
+    snaps = CarcassSnap.__table__
+    if full:
+        db.session.execute(snaps.delete().where(snaps.c.site_id == site.id))
+        changed = located
+    else:
+        # Drop carcasses deleted, moved to another site or stripped of coordinates
+        db.session.execute(snaps.delete().where(
+            snaps.c.site_id == site.id,
+            snaps.c.carcass_id.not_in(located.with_entities(Carcass.id).scalar_subquery())
+        ))
+        # >= re-snaps rows sharing the old watermark; harmless, as snapping is idempotent
+        changed = located.filter(Carcass.updated_at >= run.watermark) if run.watermark else located
+
+    rows = changed.with_entities(Carcass.id, Carcass.longitude, Carcass.latitude).all()
+    n_segments = max(1, int(np.ceil(road.total_m / segment_m)))
+    if rows:
+        ids = [r[0] for r in rows]
+        chainage, offset = road.snap([(r[1], r[2]) for r in rows])
+        segments = np.minimum(chainage // segment_m, n_segments - 1).astype(np.int64)
+        for i in range(0, len(ids), 1000):
+            db.session.execute(snaps.delete().where(snaps.c.carcass_id.in_(ids[i:i + 1000])))
+        keep = np.nonzero(offset <= cfg['HOTSPOT_SNAP_M'])[0]
+        if len(keep):
+            db.session.execute(snaps.insert(), [
+                {'carcass_id': ids[i], 'site_id': site.id, 'segment': int(segments[i]),
+                 'chainage_m': float(chainage[i]), 'offset_m': float(offset[i])}
+                for i in keep.tolist()
+            ])
+
+    counts = np.zeros(n_segments)
+    for segment, n in db.session.query(CarcassSnap.segment, func.count()).filter(
+            CarcassSnap.site_id == site.id).group_by(CarcassSnap.segment):
+        counts[min(segment, n_segments - 1)] += n
+    window_counts, expected, p_values, hotspot, rank = segment_hotspot_test(
+        counts, cfg['HOTSPOT_WINDOW'], cfg['HOTSPOT_ALPHA']
+    )
+
+    stats = RoadSegmentStat.__table__
+    db.session.execute(stats.delete().where(stats.c.site_id == site.id))
+    db.session.execute(stats.insert(), [
+        {'site_id': site.id, 'segment': i, 'count': int(counts[i]), 'window_count': int(window_counts[i]),
+         'expected': float(expected[i]), 'p_value': float(p_values[i]),
+         'is_hotspot': bool(hotspot[i]), 'rank': int(rank[i])}
+        for i in range(n_segments)
+    ])
+    db.session.merge(RoadHotspotRun(
+        site_id=site.id, geometry_hash=geometry_hash, watermark=watermark,
+        carcass_count=carcass_count, computed_at=ist_now()
+    ))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker refreshed the same site concurrently; its result stands
+        db.session.rollback()
+        return False
+    return True
+
+def refresh_road_hotspots(sites=None):
+    """Refreshes every site (or the given ones) that has road geometry. Returns {SITE CODE: SiteRoad}."""
+    roads = road_network()
+    for site in (Site.query.all() if sites is None else sites):
+        road = roads.get(site.code.upper())
+        if road is not None:
+            refresh_site_hotspots(site, road)
+    return roads
+
 # ========================
 # HELPERS FOR LABELS
 # ========================
 
+CODE_CHARS = string.ascii_uppercase + string.digits
+
+def carcass_code_usage():
+    """
+    How full the current carcass code width is, counting pooled codes as
+    used. Issued codes per width come from the code_width:<n> counters, so
+    this never scans the carcass table.
+    """
+    issued_by_width = {
+        int(key.partition(':')[2]): value
+        for key, value in db.session.query(StatCounter.key, StatCounter.value)
+        .filter(StatCounter.key.between('code_width:', 'code_width:~'))
+        if value
+    }
+    width = db.session.query(func.max(CarcassCodePool.width)).scalar() or \
+        max(issued_by_width, default=4)
+    issued = issued_by_width.get(width, 0)
+    pooled = CarcassCodePool.query.filter_by(width=width).count()
+    capacity = len(CODE_CHARS) ** width
+    return {
+        'width': width,
+        'issued': issued,
+        'pooled': pooled,
+        'capacity': capacity,
+        'fraction_used': (issued + pooled) / capacity,
+    }
+
+def refill_carcass_code_pool(batch_size):
+    """
+    Adds batch_size shuffled, unused codes to the pool. Codes widen by one
+    character once CARCASS_CODE_MAX_FILL of the current width is taken,
+    so random draws never have to fight a nearly full space.
+    """
+    usage = carcass_code_usage()
+    width = usage['width']
+    if usage['fraction_used'] >= current_app.config['CARCASS_CODE_MAX_FILL']:
+        width += 1
+
+    fresh = set()
+    while len(fresh) < batch_size:
+        candidates = {''.join(random.choices(CODE_CHARS, k=width)) for _ in range(batch_size - len(fresh))}
+        candidates -= fresh
+        taken = {r[0] for r in db.session.query(Carcass.code).filter(Carcass.code.in_(candidates))}
+        taken |= {r[0] for r in db.session.query(CarcassCodePool.code).filter(CarcassCodePool.code.in_(candidates))}
+        fresh |= candidates - taken
+
+    codes = list(fresh)
+    random.shuffle(codes)
+    try:
+        with db.session.begin_nested():
+            db.session.execute(
+                CarcassCodePool.__table__.insert(),
+                [{'code': code, 'width': width} for code in codes]
+            )
+    except IntegrityError:
+        pass  # a concurrent refill drew the same code; the caller just tries again
+
 def generate_unique_carcass_code():
-    chars = string.ascii_uppercase + string.digits
-    while True:
-        code = ''.join(random.choices(chars, k=4))
-        if not Carcass.query.filter_by(code=code).first():
-            return code
+    return generate_unique_carcass_codes(1)[0]
 
-def next_sequence_for_site_date(site_code, date_str):
-    like_prefix = f"{site_code}-{date_str}-%"
-    count = Sample.query.filter(Sample.label.like(like_prefix)).count()
-    return count + 1
+def generate_unique_carcass_codes(n):
+    """
+    Claims n codes from the pre-allocated pool. Codes are taken with
+    DELETE ... RETURNING, so a code is handed to exactly one transaction
+    and no existence probe against carcass is needed.
+    """
+    pool = CarcassCodePool.__table__
+    batch_size = current_app.config['CARCASS_CODE_POOL_BATCH']
+    codes = []
+    while len(codes) < n:
+        want = n - len(codes)
+        candidates = [r[0] for r in db.session.execute(
+            select(pool.c.code).order_by(pool.c.id).limit(want)
+        )]
+        if len(candidates) < want:
+            refill_carcass_code_pool(max(batch_size, want))
+            continue
+        claimed = db.session.execute(
+            pool.delete().where(pool.c.code.in_(candidates)).returning(pool.c.code)
+        )
+        codes.extend(r[0] for r in claimed)
+    return codes
+
+def next_sequence_for_site_date(site_code, date_str, count=1):
+    """
+    Issues the next label sequence for a site/day from the label_sequence
+    counter. The increment is a single-row UPDATE, so it is constant time
+    and the row lock serialises concurrent workers until the caller
+    commits. The counter is seeded from existing labels the first time a
+    site/day is seen. With count > 1 a block of consecutive numbers is
+    reserved and the first one is returned.
+    """
+    table = LabelSequence.__table__
+    key = (table.c.site_code == site_code) & (table.c.date_str == date_str)
+
+    for _ in range(3):
+        result = db.session.execute(
+            table.update().where(key).values(last_value=table.c.last_value + count)
+        )
+        if result.rowcount:
+            return db.session.execute(select(table.c.last_value).where(key)).scalar_one() - count + 1
+
+        seed = Sample.query.filter(Sample.label.like(f"{site_code}-{date_str}-%")).count()
+        try:
+            with db.session.begin_nested():
+                db.session.execute(
+                    table.insert().values(site_code=site_code, date_str=date_str, last_value=seed + count)
+                )
+            return seed + 1
+        except IntegrityError:
+            # Another worker created the counter first; increment theirs instead
+            continue
+
+    raise RuntimeError(f"Could not allocate a label sequence for {site_code}-{date_str}")
 
 def make_label(site_code, dt, seq, sample_type):
     date_str = dt.strftime('%Y%m%d')
@@ -144,13 +1224,263 @@ def make_label(site_code, dt, seq, sample_type):
     rand = uuid.uuid4().hex[:4].upper()
     return f"{site_code}-{date_str}-{seq_str}-{type_code}-{rand}"
 
+def label_png_path(label):
+    return os.path.join(current_app.config["LABEL_DIR"], secure_filename(f"{label}.png"))
+
+def render_qr_png(label):
+    buf = BytesIO()
+    qrcode.make(label).save(buf, format="PNG")
+    return buf.getvalue()
+
+def write_png_atomically(path, png):
+    # Write-then-rename so a concurrent reader never sees a half-written file
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(png)
+    os.replace(tmp, path)
+
 def generate_qr_for_label(label):
-    img = qrcode.make(label)
-    fname = secure_filename(f"{label}.png")
-    path = os.path.join(current_app.config["LABEL_DIR"], fname)
-    img.save(path)
+    # Warms the on-disk cache; qr_png_bytes may already have written it
+    path = label_png_path(label)
+    png = qr_png_bytes(label)
+    if not os.path.exists(path):
+        write_png_atomically(path, png)
     return path
 
+# Rendered PNG bytes keyed by label (sized from QR_CACHE_SIZE in create_app)
+qr_png_cache = LRUCache()
+
+def qr_png_bytes(label):
+    """
+    QR PNG for a label: memory LRU first, then the optional on-disk cache in
+    LABEL_DIR, rendering only on a miss in both. Labels never change, so
+    the label itself is the cache key.
+    """
+    png = qr_png_cache.get(label)
+    if png is not None:
+        return png
+
+    use_disk = current_app.config['QR_DISK_CACHE']
+    path = label_png_path(label)
+    if use_disk and os.path.exists(path):
+        with open(path, 'rb') as f:
+            png = f.read()
+    else:
+        png = render_qr_png(label)
+        if use_disk:
+            write_png_atomically(path, png)
+
+    qr_png_cache.set(label, png)
+    return png
+
+def qr_etag(label):
+    return hashlib.sha256(label.encode('utf-8')).hexdigest()[:32]
+
+# ========================
+# LABEL SHEETS
+# ========================
+
+class StreamingPdf:
+    """
+    Minimal PDF writer that emits one full-page grayscale image per page as
+    soon as it is added. The page tree and catalog are written last, so only
+    byte offsets are kept in memory however many pages are produced.
+    """
+
+    def __init__(self, dpi):
+        self.dpi = dpi
+        self.offsets = {}
+        self.page_ids = []
+        self.position = 0
+        self.next_id = 3  # 1 = catalog, 2 = page tree, both written in finish()
+
+    def _emit(self, data):
+        self.position += len(data)
+        return data
+
+    def _object(self, obj_id, body, stream=None):
+        self.offsets[obj_id] = self.position
+        out = f"{obj_id} 0 obj\n".encode() + body
+        if stream is not None:
+            out += b"\nstream\n" + stream + b"\nendstream"
+        return self._emit(out + b"\nendobj\n")
+
+    def header(self):
+        return self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def add_page(self, img):
+        img = img.convert('L')
+        width_pt = img.width * 72.0 / self.dpi
+        height_pt = img.height * 72.0 / self.dpi
+        image_id, content_id, page_id = self.next_id, self.next_id + 1, self.next_id + 2
+        self.next_id += 3
+        self.page_ids.append(page_id)
+
+        pixels = zlib.compress(img.tobytes())
+        content = f"q {width_pt:.2f} 0 0 {height_pt:.2f} 0 0 cm /Im Do Q".encode()
+        return b"".join([
+            self._object(image_id, (
+                f"<< /Type /XObject /Subtype /Image /Width {img.width} /Height {img.height} "
+                f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(pixels)} >>"
+            ).encode(), pixels),
+            self._object(content_id, f"<< /Length {len(content)} >>".encode(), content),
+            self._object(page_id, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt:.2f} {height_pt:.2f}] "
+                f"/Resources << /XObject << /Im {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+            ).encode()),
+        ])
+
+    def finish(self):
+        kids = " ".join(f"{i} 0 R" for i in self.page_ids)
+        out = self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode())
+        out += self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_at = self.position
+        lines = [f"xref\n0 {self.next_id}\n", "0000000000 65535 f \n"]
+        lines += [f"{self.offsets[i]:010d} 00000 n \n" for i in range(1, self.next_id)]
+        lines.append(f"trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n")
+        return out + self._emit("".join(lines).encode())
+
+def label_sheet_pages(samples, cols, rows, dpi):
+    """
+    Lays samples out cols x rows per A4 page and yields one PIL page at a
+    time. QR bitmaps come from qr_png_bytes, so reprints skip rendering.
+    """
+    page_w, page_h = int(8.27 * dpi), int(11.69 * dpi)
+    margin = int(0.3 * dpi)
+    cell_w = (page_w - 2 * margin) // cols
+    cell_h = (page_h - 2 * margin) // rows
+    qr_size = cell_h - 10
+    # Size text so a 16-character line fits beside the QR
+    text_w = cell_w - qr_size - 20
+    font = ImageFont.load_default(size=max(8, min(cell_h // 9, int(text_w / (16 * 0.6)))))
+    per_page = cols * rows
+
+    page, draw = None, None
+    for i, s in enumerate(samples):
+        slot = i % per_page
+        if slot == 0:
+            if page is not None:
+                yield page
+            page = Image.new('L', (page_w, page_h), 255)
+            draw = ImageDraw.Draw(page)
+
+        x = margin + (slot % cols) * cell_w
+        y = margin + (slot // cols) * cell_h
+        qr = Image.open(BytesIO(qr_png_bytes(s.label))).convert('L')
+        page.paste(qr.resize((qr_size, qr_size), Image.NEAREST), (x + 5, y + 5))
+
+        # Split "SITE-YYYYMMDD-SEQ-TYP-XXXX" after the date to keep lines short
+        parts = s.label.split('-')
+        lines = [
+            '-'.join(parts[:2]),
+            '-'.join(parts[2:]),
+            f"{s.carcass.code} {s.carcass.species or ''}" if s.carcass else '',
+            s.sample_type or '',
+            s.collected_at.strftime('%Y-%m-%d') if s.collected_at else '',
+        ]
+        line_h = font.size + 4
+        for n, line in enumerate(lines):
+            draw.text((x + qr_size + 10, y + 10 + n * line_h), line, fill=0, font=font)
+        draw.rectangle([x, y, x + cell_w - 1, y + cell_h - 1], outline=200)
+
+    if page is not None:
+        yield page
+
+# ========================
+# QR RENDERING QUEUE
+# ========================
+# Samples whose qr_path is still NULL are the persistent queue: jobs lost to
+# a restart are picked up again by the next process that claims the backlog
+# (the one holding a lock on LABEL_DIR/.qr-backlog.lock), so each pending
+# label is rendered once rather than once per gunicorn worker.
+
+_qr_executor = None
+_qr_executor_pid = None
+_qr_executor_lock = threading.Lock()
+_qr_backlog_lock_file = None
+
+def claim_qr_backlog():
+    """
+    True in at most one process at a time: the lock is held for as long as
+    the claiming process lives, and released by the OS when it exits.
+    """
+    global _qr_backlog_lock_file
+    if fcntl is None:
+        return True
+    lock_file = open(os.path.join(current_app.config['LABEL_DIR'], '.qr-backlog.lock'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _qr_backlog_lock_file = lock_file
+    return True
+
+def qr_executor():
+    """
+    Process-local render pool, created lazily so each gunicorn worker gets
+    its own, and recreated after a fork since threads don't survive one.
+    """
+    global _qr_executor, _qr_executor_pid
+    with _qr_executor_lock:
+        if _qr_executor is not None and _qr_executor_pid == os.getpid():
+            return _qr_executor
+        _qr_executor = ThreadPoolExecutor(
+            max_workers=current_app.config['QR_WORKERS'],
+            thread_name_prefix='qr-render'
+        )
+        _qr_executor_pid = os.getpid()
+    if claim_qr_backlog():
+        pending = [r[0] for r in db.session.query(Sample.id).filter(Sample.qr_path.is_(None))]
+        submit_qr_jobs(_qr_executor, pending)
+    return _qr_executor
+
+def _log_qr_failure(app, future):
+    exc = future.exception()
+    if exc is not None:
+        app.logger.error("QR render batch failed; its samples are retried when the backlog is next claimed", exc_info=exc)
+
+def render_qr_batch(app, sample_ids):
+    """Writes the disk-cache PNGs for a batch of samples and records their paths."""
+    with app.app_context():
+        samples = db.session.query(Sample.id, Sample.label).filter(Sample.id.in_(sample_ids)).all()
+        rows = [{'sid': sid, 'path': generate_qr_for_label(label)} for sid, label in samples]
+        if rows:
+            # qr_path is a server-side cache marker, not an edit: leave
+            # updated_at/version alone so sync and page ETags don't see one
+            table = Sample.__table__
+            db.session.execute(
+                table.update()
+                .where(table.c.id == bindparam('sid'))
+                .values({**keep_onupdate(table), 'qr_path': bindparam('path')}),
+                rows
+            )
+        db.session.commit()
+        return len(samples)
+
+def submit_qr_jobs(executor, sample_ids):
+    app = current_app._get_current_object()
+    batch_size = app.config['QR_BATCH_SIZE']
+    for i in range(0, len(sample_ids), batch_size):
+        future = executor.submit(render_qr_batch, app, sample_ids[i:i + batch_size])
+        future.add_done_callback(lambda f: _log_qr_failure(app, f))
+
+def enqueue_qr_jobs(sample_ids):
+    """
+    Queues QR rendering for the given (already committed) samples. With
+    QR_ASYNC off the labels are rendered inline, as before. This only warms
+    the disk cache: with QR_DISK_CACHE off nothing is queued or written and
+    sample_qr renders each label on demand.
+    """
+    sample_ids = list(sample_ids)
+    if not sample_ids or not current_app.config['QR_DISK_CACHE']:
+        return
+    if not current_app.config['QR_ASYNC']:
+        render_qr_batch(current_app._get_current_object(), sample_ids)
+        return
+    submit_qr_jobs(qr_executor(), sample_ids)
+
 def get_carcasses_by_label_suffix(suffix):
     """
     Searches for samples ending with the given 4-character suffix 
@@ -160,12 +1490,921 @@ def get_carcasses_by_label_suffix(suffix):
         return []
         
     suffix = suffix.upper() # Match uppercase label pattern
-    matching_samples = Sample.query.filter(Sample.label.like(f"%-{suffix}")).all()
+    matching_samples = (
+        Sample.query
+        .options(joinedload(Sample.carcass))
+        .filter(Sample.label_suffix == suffix)
+        .all()
+    )
     
     # Extract unique carcasses using a set to filter out duplicate matches
     carcasses = {s.carcass for s in matching_samples if s.carcass}
     return list(carcasses)
 
+# ========================
+# BULK IMPORT
+# ========================
+
+IMPORT_COLUMNS = [
+    'site_code', 'carcass_ref', 'species', 'animal_type', 'encounter_type',
+    'datetime_found', 'latitude', 'longitude', 'carcass_notes',
+    'sample_type', 'collected_by', 'collected_at', 'storage', 'sample_notes'
+]
+
+def _clean(value, title=False):
+    value = (value or '').strip()
+    if not value:
+        return None
+    return value.title() if title else value
+
+def _parse_import_row(row, site_ids):
+    """Validates one CSV row; returns a dict of typed values or raises ValueError."""
+    site_code = (row.get('site_code') or '').strip().upper()
+    if site_code not in site_ids:
+        raise ValueError(f"unknown site_code {row.get('site_code')!r}")
+
+    found = _clean(row.get('datetime_found'))
+    collected = _clean(row.get('collected_at'))
+    lat, lon = parse_coordinates(_clean(row.get('latitude')), _clean(row.get('longitude')))
+
+    return {
+        'site_id': site_ids[site_code],
+        'site_code': site_code,
+        'carcass_ref': _clean(row.get('carcass_ref')),
+        'species': _clean(row.get('species'), title=True),
+        'animal_type': _clean(row.get('animal_type'), title=True),
+        'encounter_type': _clean(row.get('encounter_type')) or 'Roadkill',
+        'datetime_found': datetime.fromisoformat(found) if found else ist_now(),
+        'latitude': lat,
+        'longitude': lon,
+        'carcass_notes': _clean(row.get('carcass_notes')),
+        'sample_type': _clean(row.get('sample_type')),
+        'collected_by': _clean(row.get('collected_by')),
+        'collected_at': datetime.fromisoformat(collected) if collected else None,
+        'storage': _clean(row.get('storage')),
+        'sample_notes': _clean(row.get('sample_notes')),
+    }
+
+def _import_chunk(rows, reporter_id, reporter_name, carcass_ids_by_ref):
+    """
+    Inserts one chunk of validated rows in a single transaction. Carcass
+    codes and label sequences are reserved in bulk for the whole chunk.
+    Returns (new carcass count, new sample ids).
+    """
+    pending_refs = {}
+    new_carcasses = []
+    carcass_for_row = []
+    # One code per new encounter: rows without a ref, plus each distinct
+    # ref not imported yet (however many rows repeat it)
+    new_refs = {r['carcass_ref'] for r in rows if r['carcass_ref'] and r['carcass_ref'] not in carcass_ids_by_ref}
+    codes = iter(generate_unique_carcass_codes(
+        len(new_refs) + sum(1 for r in rows if not r['carcass_ref'])
+    ))
+    for r in rows:
+        ref = r['carcass_ref']
+        if ref and ref in carcass_ids_by_ref:
+            carcass_for_row.append(carcass_ids_by_ref[ref])
+            continue
+        if ref and ref in pending_refs:
+            carcass_for_row.append(pending_refs[ref])
+            continue
+        carcass = Carcass(
+            code=next(codes),
+            site_id=r['site_id'],
+            reporter_id=reporter_id,
+            species=r['species'],
+            animal_type=r['animal_type'],
+            encounter_type=r['encounter_type'],
+            datetime_found=r['datetime_found'],
+            latitude=r['latitude'],
+            longitude=r['longitude'],
+            notes=r['carcass_notes']
+        )
+        new_carcasses.append(carcass)
+        if ref:
+            pending_refs[ref] = carcass
+        carcass_for_row.append(carcass)
+
+    # One block of label sequences per site/day in this chunk
+    groups = {}
+    for r, c in zip(rows, carcass_for_row):
+        if r['sample_type']:
+            collected_at = r['collected_at'] or r['datetime_found']
+            groups.setdefault((r['site_code'], collected_at.strftime('%Y%m%d')), []).append((r, c, collected_at))
+
+    samples = []
+    for (site_code, date_str), members in groups.items():
+        seq = next_sequence_for_site_date(site_code, date_str, count=len(members))
+        for offset, (r, c, collected_at) in enumerate(members):
+            sample = Sample(
+                uuid=str(uuid.uuid4()),
+                label=make_label(site_code, collected_at, seq + offset, r['sample_type']),
+                sample_type=r['sample_type'],
+                collected_by=r['collected_by'] or reporter_name,
+                collected_at=collected_at,
+                storage=r['storage'],
+                notes=r['sample_notes']
+            )
+            if isinstance(c, Carcass):
+                sample.carcass = c
+            else:
+                sample.carcass_id = c
+            samples.append(sample)
+
+    db.session.add_all(new_carcasses)
+    db.session.add_all(samples)
+    db.session.flush()
+
+    # Read ids before commit expires the objects (which would reload each one)
+    sample_ids = [s.id for s in samples]
+    for ref, carcass in pending_refs.items():
+        carcass_ids_by_ref[ref] = carcass.id
+    db.session.commit()
+    return len(new_carcasses), sample_ids
+
+def import_csv(stream, reporter=None, chunk_size=500):
+    """
+    Stream-parses a CSV of encounters (columns: IMPORT_COLUMNS) and inserts
+    them in chunk_size transactions. Each row is one encounter, optionally
+    with one sample; rows sharing a carcass_ref add samples to the same
+    encounter. Invalid rows are skipped and reported by line number.
+    """
+    site_ids = {code: site_id for site_id, code in db.session.query(Site.id, Site.code)}
+    reporter_id = reporter.id if reporter else None
+    reporter_name = reporter.username if reporter else None
+    carcass_ids_by_ref = {}
+    result = {'carcasses': 0, 'samples': 0, 'errors': []}
+    sample_ids = []
+
+    def flush(chunk):
+        n_carcasses, ids = _import_chunk(chunk, reporter_id, reporter_name, carcass_ids_by_ref)
+        result['carcasses'] += n_carcasses
+        result['samples'] += len(ids)
+        sample_ids.extend(ids)
+
+    reader = csv.DictReader(stream)
+    reader.fieldnames = [(f or '').strip().lower() for f in reader.fieldnames or []]
+    chunk = []
+    for row in reader:
+        try:
+            chunk.append(_parse_import_row(row, site_ids))
+        except (ValueError, TypeError) as e:
+            result['errors'].append((reader.line_num, str(e)))
+            continue
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    enqueue_qr_jobs(sample_ids)
+    facet_cache.invalidate()
+    return result
+
+# ========================
+# FIELD SYNC
+# ========================
+
+def _iso(dt):
+    return dt.isoformat() if dt else None
+
+def _parse_dt(value):
+    return datetime.fromisoformat(value) if value else None
+
+def carcass_to_dict(c, site_code):
+    return {
+        'uuid': c.uuid, 'id': c.id, 'code': c.code, 'site_code': site_code,
+        'species': c.species, 'animal_type': c.animal_type,
+        'encounter_type': c.encounter_type, 'datetime_found': _iso(c.datetime_found),
+        'latitude': c.latitude, 'longitude': c.longitude, 'notes': c.notes,
+        'updated_at': _iso(c.updated_at),
+    }
+
+def sample_to_dict(s, carcass_uuid):
+    return {
+        'uuid': s.uuid, 'id': s.id, 'label': s.label, 'carcass_uuid': carcass_uuid,
+        'sample_type': s.sample_type, 'collected_by': s.collected_by,
+        'collected_at': _iso(s.collected_at), 'storage': s.storage, 'notes': s.notes,
+        'status': s.status, 'processing_result': s.processing_result,
+        'updated_at': _iso(s.updated_at),
+    }
+
+def apply_sync_upload(payload, user):
+    """
+    Creates the carcasses and samples in a sync upload in one transaction.
+    Records are keyed by their client-generated uuid, so re-sending a batch
+    after a dropped connection returns the existing rows instead of
+    duplicating them.
+    """
+    carcass_items = payload.get('carcasses') or []
+    sample_items = payload.get('samples') or []
+    result = {'carcasses': {}, 'samples': {}, 'errors': []}
+
+    def field(item, key):
+        # Clients may send numbers (or worse) where strings belong
+        value = item.get(key)
+        return None if value is None else str(value)
+
+    def valid_uuid(value):
+        try:
+            return str(uuid.UUID(str(value)))
+        except ValueError:
+            return None
+
+    # Results are keyed by the uuid as the client sent it (which may be
+    # upper case), while lookups use the normalized form
+    sent = {}
+    def normalized(value):
+        key = valid_uuid(value)
+        if key is not None:
+            sent.setdefault(key, value)
+        return key
+
+    site_ids = {code: site_id for site_id, code in db.session.query(Site.id, Site.code)}
+    uuids = [normalized(i.get('uuid')) for i in carcass_items] + [normalized(i.get('carcass_uuid')) for i in sample_items]
+    carcasses = {c.uuid: c for c in Carcass.query.filter(Carcass.uuid.in_([u for u in uuids if u]))}
+
+    new_items = [i for i in carcass_items if valid_uuid(i.get('uuid')) not in carcasses]
+    codes = iter(generate_unique_carcass_codes(len(new_items)))
+    for item in carcass_items:
+        cid = valid_uuid(item.get('uuid'))
+        try:
+            if cid is None:
+                raise ValueError("uuid must be a UUID")
+            if cid not in carcasses:
+                site_code = (field(item, 'site_code') or '').upper()
+                if site_code not in site_ids:
+                    raise ValueError(f"unknown site_code {site_code!r}")
+                lat, lon = parse_coordinates(item.get('latitude'), item.get('longitude'))
+                carcass = Carcass(
+                    uuid=cid,
+                    code=next(codes),
+                    site_id=site_ids[site_code],
+                    reporter_id=user.id,
+                    species=_clean(field(item, 'species'), title=True),
+                    animal_type=_clean(field(item, 'animal_type'), title=True),
+                    encounter_type=field(item, 'encounter_type') or 'Roadkill',
+                    datetime_found=_parse_dt(field(item, 'datetime_found')) or ist_now(),
+                    latitude=lat,
+                    longitude=lon,
+                    notes=field(item, 'notes')
+                )
+                db.session.add(carcass)
+                carcasses[cid] = carcass
+        except (ValueError, TypeError) as e:
+            result['errors'].append({'uuid': item.get('uuid'), 'error': str(e)})
+    db.session.flush()
+    for cid, c in carcasses.items():
+        result['carcasses'][sent.get(cid, cid)] = {'id': c.id, 'code': c.code}
+
+    sample_uuids = [normalized(i.get('uuid')) for i in sample_items]
+    existing = {s.uuid: s for s in Sample.query.filter(Sample.uuid.in_([u for u in sample_uuids if u]))}
+    created = []
+    for item, sid in zip(sample_items, sample_uuids):
+        try:
+            if sid is None:
+                raise ValueError("uuid must be a UUID")
+            sample = existing.get(sid)
+            if sample is None:
+                carcass = carcasses.get(valid_uuid(item.get('carcass_uuid')))
+                if carcass is None:
+                    raise ValueError("unknown carcass_uuid")
+                site_code = carcass.site.code
+                collected_at = _parse_dt(field(item, 'collected_at')) or ist_now()
+                sample_type = field(item, 'sample_type')
+                seq = next_sequence_for_site_date(site_code, collected_at.strftime('%Y%m%d'))
+                sample = Sample(
+                    carcass_id=carcass.id,
+                    uuid=sid,
+                    label=make_label(site_code, collected_at, seq, sample_type),
+                    sample_type=sample_type,
+                    collected_by=field(item, 'collected_by') or user.username,
+                    collected_at=collected_at,
+                    storage=field(item, 'storage'),
+                    notes=field(item, 'notes')
+                )
+                db.session.add(sample)
+                existing[sid] = sample
+                created.append(sample)
+        except (ValueError, TypeError) as e:
+            result['errors'].append({'uuid': item.get('uuid'), 'error': str(e)})
+    db.session.flush()
+    for sid, s in existing.items():
+        result['samples'][sent.get(sid, sid)] = {'id': s.id, 'label': s.label}
+
+    created_ids = [s.id for s in created]
+    db.session.commit()
+    if new_items or created_ids:
+        enqueue_qr_jobs(created_ids)
+        facet_cache.invalidate()
+    return result
+
+def encode_sync_cursor(positions):
+    # "<carcass updated_at>|<id>;<sample updated_at>|<id>", a side left
+    # empty until that table has sent a row
+    return ';'.join(f"{_iso(p[0])}|{p[1]}" if p else '' for p in positions)
+
+def decode_sync_cursor(value):
+    """Inverse of encode_sync_cursor; raises ValueError if malformed."""
+    parts = value.split(';')
+    if len(parts) != 2:
+        raise ValueError("cursor must have two parts")
+    positions = []
+    for part in parts:
+        if part:
+            ts, row_id = part.rsplit('|', 1)
+            positions.append((datetime.fromisoformat(ts), int(row_id)))
+        else:
+            positions.append(None)
+    return positions
+
+def sync_changes_since(positions, limit):
+    """
+    Carcasses and samples updated after their (updated_at, id) position,
+    oldest first, at most limit of each. Each table resumes exactly after
+    the last row it sent, so rows sharing one updated_at (bulk edits,
+    imports) page through instead of repeating. Returns the next cursor,
+    plus a plain watermark for clients that still send 'since'.
+    """
+    c_query = (
+        db.session.query(Carcass, Site.code)
+        .outerjoin(Site, Carcass.site_id == Site.id)
+        .order_by(Carcass.updated_at, Carcass.id)
+    )
+    s_query = (
+        db.session.query(Sample, Carcass.uuid)
+        .outerjoin(Carcass, Sample.carcass_id == Carcass.id)
+        .order_by(Sample.updated_at, Sample.id)
+    )
+    c_pos, s_pos = positions
+    if c_pos:
+        c_query = c_query.filter(tuple_(Carcass.updated_at, Carcass.id) > c_pos)
+    if s_pos:
+        s_query = s_query.filter(tuple_(Sample.updated_at, Sample.id) > s_pos)
+
+    carcass_rows = c_query.limit(limit + 1).all()
+    sample_rows = s_query.limit(limit + 1).all()
+
+    has_more = False
+    next_positions = []
+    for rows, pos in ((carcass_rows, c_pos), (sample_rows, s_pos)):
+        if len(rows) > limit:
+            del rows[limit:]
+            has_more = True
+        last = rows[-1][0] if rows else None
+        next_positions.append((last.updated_at, last.id) if last else pos)
+    stamps = [p[0] for p in next_positions if p and p[0]]
+
+    return {
+        'carcasses': [carcass_to_dict(c, code) for c, code in carcass_rows],
+        'samples': [sample_to_dict(s, cuuid) for s, cuuid in sample_rows],
+        'cursor': encode_sync_cursor(next_positions),
+        'watermark': _iso(min(stamps, default=None)),
+        'has_more': has_more,
+    }
+
+# ========================
+# HELPERS FOR QUERIES
+# ========================
+
+def iter_keyset(query, key_column, batch_size):
+    """
+    Walks a query in ascending key_column order, batch_size rows at a time.
+    Each batch resumes after the last key seen instead of using OFFSET, so
+    every round-trip is an index range scan no matter how deep we are.
+    """
+    last_key = None
+    while True:
+        q = query
+        if last_key is not None:
+            q = q.filter(key_column > last_key)
+        batch = q.order_by(key_column).limit(batch_size).all()
+        if not batch:
+            return
+        for row in batch:
+            yield row
+        last_key = getattr(batch[-1], key_column.key)
+        if len(batch) < batch_size:
+            return
+
+def sites_with_counts():
+    """
+    All sites, each with an encounter_count attribute filled in by one
+    GROUP BY query, so templates never touch the carcasses relationship.
+    """
+    rows = (
+        db.session.query(Site, func.count(Carcass.id))
+        .outerjoin(Carcass, Carcass.site_id == Site.id)
+        .group_by(Site.id)
+        .order_by(Site.id)
+        .all()
+    )
+    sites = []
+    for site, count in rows:
+        site.encounter_count = count
+        sites.append(site)
+    return sites
+
+# ========================
+# FACET CACHE
+# ========================
+
+class FacetCache:
+    """
+    Sorted dropdown vocabularies (species, sample types, animal types and
+    site codes) held in process. Writes in this worker update it in place;
+    other workers pick changes up after FACET_CACHE_TTL seconds, or at once
+    when FACET_CACHE_FILE is set, since the vocabularies are then also
+    published to that file and each read only costs an os.stat().
+    """
+
+    QUERIES = {
+        'species': lambda: Carcass.species,
+        'sample_types': lambda: Sample.sample_type,
+        'animal_types': lambda: Carcass.animal_type,
+        'site_codes': lambda: Site.code,
+    }
+
+    def __init__(self):
+        self.ttl = 300
+        self.path = None
+        self._data = None
+        self._loaded_at = 0
+        self._file_mtime = None
+        self._lock = threading.Lock()
+
+    def configure(self, ttl, path=None):
+        self.ttl = ttl
+        self.path = path
+        self._data = None
+
+    def _file_stamp(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _publish(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self._data, f)
+        os.replace(tmp, self.path)
+        self._file_mtime = self._file_stamp()
+
+    def _load(self):
+        now = time.monotonic()
+        fresh = self._data is not None and now - self._loaded_at < self.ttl
+        if not self.path:
+            if not fresh:
+                self._refresh()
+            return
+
+        stamp = self._file_stamp()
+        if fresh and stamp == self._file_mtime:
+            return
+        # Another worker published newer vocabularies; adopt them if not expired
+        if stamp is not None and stamp != self._file_mtime and time.time() - stamp / 1e9 < self.ttl:
+            try:
+                with open(self.path) as f:
+                    self._data = json.load(f)
+                self._file_mtime = stamp
+                self._loaded_at = now
+                return
+            except (OSError, ValueError):
+                pass
+        self._refresh()
+
+    def _refresh(self):
+        self._data = {
+            kind: sorted(
+                r[0] for r in db.session.query(column()).distinct().filter(column().isnot(None))
+            )
+            for kind, column in self.QUERIES.items()
+        }
+        self._loaded_at = time.monotonic()
+        self._publish()
+
+    def get(self, kind):
+        with self._lock:
+            self._load()
+            return list(self._data[kind])
+
+    def add(self, kind, value):
+        """Records a value that a just-committed write may have introduced."""
+        if not value:
+            return
+        with self._lock:
+            self._load()
+            values = self._data[kind]
+            i = bisect.bisect_left(values, value)
+            if i < len(values) and values[i] == value:
+                return
+            values.insert(i, value)
+            self._publish()
+
+    def invalidate(self):
+        """Drops the vocabularies after an edit or delete that may remove values."""
+        with self._lock:
+            self._data = None
+            if self.path:
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+                self._file_mtime = None
+
+facet_cache = FacetCache()
+
+# ========================
+# USER CACHE
+# ========================
+
+class UserCache:
+    """
+    Column values of recently seen users, so load_user can rebuild
+    current_user without a query. Entries live USER_CACHE_TTL seconds.
+    Routes that change a user call invalidate() after committing; other
+    workers notice at once when USER_CACHE_STAMP_FILE is set (invalidate
+    touches it and every read costs one os.stat()), otherwise within the TTL.
+    """
+
+    def __init__(self):
+        self.ttl = 30
+        self.path = None
+        self._data = {}
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def configure(self, ttl, path=None):
+        self.ttl = ttl
+        self.path = path
+        self._data = {}
+
+    def _file_stamp(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def get(self, user_id):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            if self.path:
+                stamp = self._file_stamp()
+                if stamp != self._stamp:
+                    self._data.clear()
+                    self._stamp = stamp
+            entry = self._data.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self._data.pop(user_id, None)
+                return None
+            return entry[1]
+
+    def set(self, user):
+        if self.ttl <= 0:
+            return
+        values = {c.key: getattr(user, c.key) for c in inspect(User).column_attrs}
+        with self._lock:
+            self._data[user.id] = (time.monotonic() + self.ttl, values)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._data.pop(user_id, None)
+            if self.path:
+                with open(self.path, 'w') as f:
+                    f.write(str(time.time_ns()))
+                self._stamp = self._file_stamp()
+
+user_cache = UserCache()
+
+# ========================
+# HTTP CACHING
+# ========================
+# Read-only pages are validated with ETags built from the row versions of
+# everything they render, so a repeat visit costs a couple of indexed
+# lookups and a 304 instead of the full query and template render. With
+# FRAGMENT_CACHE_SIZE > 0 the rendered HTML is also kept in process under
+# the same key, so a browser without the page cached is served without
+# rendering either.
+
+# Rendered pages keyed by ETag (sized from FRAGMENT_CACHE_SIZE in create_app)
+fragment_cache = LRUCache(maxsize=0)
+
+def page_etag(*parts):
+    """
+    ETag for the current endpoint's page given the versions of what it
+    shows. The viewer's id and role are mixed in because the layout differs
+    per user, and so is the year printed in the footer.
+    """
+    viewer = (current_user.id, current_user.role) if current_user.is_authenticated else None
+    key = repr((request.endpoint, viewer, ist_now().year) + parts)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def conditional_page(etag, render):
+    """
+    Answers If-None-Match with a 304 before render() is called, otherwise
+    serves the page from fragment_cache or renders and stores it. Pages with
+    flashed messages waiting are always rendered and never cached, since
+    rendering is what consumes the messages.
+    """
+    if session.get('_flashes'):
+        resp = Response(render(), mimetype='text/html')
+    elif etag in request.if_none_match:
+        resp = Response(status=304)
+        resp.set_etag(etag)
+    else:
+        html = fragment_cache.get(etag)
+        if html is None:
+            html = render()
+            fragment_cache.set(etag, html)
+        resp = Response(html, mimetype='text/html')
+        resp.set_etag(etag)
+    # Browsers must revalidate, and shared caches must not keep per-user pages
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    resp.vary.add('Cookie')
+    return resp
+
+def children_version(model, *criteria):
+    """
+    (count, max id, version sum, newest updated_at) over the model rows
+    matching criteria: it changes whenever one of them is added, edited or
+    deleted, without loading any of them.
+    """
+    return tuple(
+        db.session.query(
+            func.count(model.id), func.max(model.id),
+            func.sum(model.version), func.max(model.updated_at)
+        ).filter(*criteria).one()
+    )
+
+def bounded_count(query, cap):
+    """
+    Counts at most cap + 1 rows of query, so the cost is bounded however
+    large the match set is. Returns (count, capped).
+    """
+    n = db.session.query(func.count()).select_from(query.limit(cap + 1).subquery()).scalar()
+    return min(n, cap), n > cap
+
+def encode_cursor(collected_at, sample_id):
+    # Older samples may have no collected_at; that side is left empty
+    return f"{collected_at.isoformat() if collected_at else ''}|{sample_id}"
+
+def decode_cursor(value):
+    try:
+        ts, sample_id = value.rsplit('|', 1)
+        return (datetime.fromisoformat(ts) if ts else None), int(sample_id)
+    except ValueError:
+        abort(400, description="Invalid cursor")
+
+def after_sample_cursor(collected_at, sample_id):
+    """
+    Keyset predicate for rows after the cursor in (collected_at DESC NULLS
+    LAST, id DESC) order: undated samples come after every dated one.
+    """
+    if collected_at is None:
+        return Sample.collected_at.is_(None) & (Sample.id < sample_id)
+    return (tuple_(Sample.collected_at, Sample.id) < (collected_at, sample_id)) | Sample.collected_at.is_(None)
+
+# ========================
+# HELPERS FOR THE MAP
+# ========================
+
+def parse_bbox(value):
+    """
+    Parses a Leaflet-style "west,south,east,north" bounding box.
+    Returns None when absent and aborts with 400 when malformed.
+    """
+    if not value:
+        return None
+    try:
+        west, south, east, north = (float(v) for v in value.split(','))
+    except ValueError:
+        abort(400, description="bbox must be 'west,south,east,north'")
+    return west, south, east, north
+
+def parse_date_arg(value, name):
+    """Parses a YYYY-MM-DD query argument, aborting with 400 when malformed."""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, description=f"{name} must be an ISO date")
+
+def filter_map_carcasses(query, args):
+    """
+    Applies the map.html filters (bbox, site, animal_type, species, code
+    prefix and date range) to a query that already joins Site.
+    """
+    query = query.filter(Carcass.latitude.isnot(None), Carcass.longitude.isnot(None))
+
+    bbox = parse_bbox(args.get('bbox'))
+    if bbox:
+        west, south, east, north = bbox
+        query = query.filter(
+            Carcass.latitude.between(south, north),
+            Carcass.longitude.between(west, east)
+        )
+
+    site = args.get('site')
+    if site and site != 'all':
+        query = query.filter(Site.code == site)
+
+    animal_type = args.get('animal_type')
+    if animal_type and animal_type != 'all':
+        query = query.filter(Carcass.animal_type == animal_type)
+
+    species = args.get('species')
+    if species and species != 'all':
+        query = query.filter(Carcass.species == species)
+
+    code = args.get('code', '').strip().upper()
+    if code:
+        query = query.filter(Carcass.code.like(f"{code}%"))
+
+    date_from = args.get('date_from')
+    if date_from:
+        query = query.filter(Carcass.datetime_found >= parse_date_arg(date_from, 'date_from'))
+
+    date_to = args.get('date_to')
+    if date_to:
+        query = query.filter(Carcass.datetime_found < parse_date_arg(date_to, 'date_to') + timedelta(days=1))
+
+    return query
+
+def grid_cell(column, origin, size):
+    """
+    SQL expression for the grid row/column a coordinate falls into.
+    Shifting by origin keeps values non-negative, so SQLite's integer CAST
+    (which truncates) agrees with Postgres FLOOR.
+    """
+    scaled = (column - origin) / size
+    if db.engine.dialect.name == 'postgresql':
+        return func.floor(scaled)
+    return cast(scaled, Integer)
+
+def cluster_cell_size(zoom):
+    """Grid cell size in degrees that spans MAP_CLUSTER_CELL_PX screen pixels at zoom."""
+    return 360.0 / (2 ** zoom) * current_app.config['MAP_CLUSTER_CELL_PX'] / 256.0
+
+# ========================
+# PROFILING
+# ========================
+# Opt-in (PROFILING_ENABLED=1) request instrumentation: per-route latency
+# histograms, SQL statement counts and time per request (engine events),
+# and cProfile stacks for a sample of requests that turn out to be slow.
+# Metrics live in process memory, so under gunicorn each worker reports
+# only the requests it served.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+class RequestMetrics:
+    """Thread-safe per-process request, SQL and profile statistics."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.queries = {}
+        self.requests = {}
+        self.sql_seconds = {}
+        self.slow = {}
+        self.profiles = deque(maxlen=20)
+
+    def record(self, endpoint, method, status, seconds, query_count, sql_seconds, slow):
+        with self.lock:
+            key = (endpoint, method)
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(query_count)
+            rkey = (endpoint, method, status)
+            self.requests[rkey] = self.requests.get(rkey, 0) + 1
+            self.sql_seconds[key] = self.sql_seconds.get(key, 0.0) + sql_seconds
+            if slow:
+                self.slow[key] = self.slow.get(key, 0) + 1
+
+    def add_profile(self, endpoint, path, seconds, stats_text):
+        with self.lock:
+            self.profiles.append({
+                'endpoint': endpoint, 'path': path, 'seconds': seconds,
+                'at': ist_now(), 'stats': stats_text
+            })
+
+    def prometheus(self):
+        """Renders everything in the Prometheus text exposition format."""
+        def labels(**kv):
+            return '{' + ','.join(f'{k}="{str(v)}"' for k, v in kv.items()) + '}'
+
+        def histogram(name, help_text, series):
+            lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for (endpoint, method), h in sorted(series.items()):
+                running = 0
+                for bound, n in zip(list(h.buckets) + ['+Inf'], h.counts):
+                    running += n
+                    lines.append(f"{name}_bucket{labels(endpoint=endpoint, method=method, le=bound)} {running}")
+                lines.append(f"{name}_sum{labels(endpoint=endpoint, method=method)} {h.sum}")
+                lines.append(f"{name}_count{labels(endpoint=endpoint, method=method)} {running}")
+            return lines
+
+        with self.lock:
+            lines = histogram('roadkill_request_duration_seconds', 'Request latency by route.', self.latency)
+            lines += histogram('roadkill_request_sql_queries', 'SQL statements executed per request.', self.queries)
+            lines += ["# HELP roadkill_requests_total Requests by route and status.", "# TYPE roadkill_requests_total counter"]
+            lines += [
+                f"roadkill_requests_total{labels(endpoint=e, method=m, status=st)} {n}"
+                for (e, m, st), n in sorted(self.requests.items())
+            ]
+            lines += ["# HELP roadkill_sql_seconds_total Time spent in SQL by route.", "# TYPE roadkill_sql_seconds_total counter"]
+            lines += [
+                f"roadkill_sql_seconds_total{labels(endpoint=e, method=m)} {v}"
+                for (e, m), v in sorted(self.sql_seconds.items())
+            ]
+            lines += ["# HELP roadkill_slow_requests_total Requests slower than PROFILE_SLOW_MS.", "# TYPE roadkill_slow_requests_total counter"]
+            lines += [
+                f"roadkill_slow_requests_total{labels(endpoint=e, method=m)} {n}"
+                for (e, m), n in sorted(self.slow.items())
+            ]
+        return '\n'.join(lines) + '\n'
+
+request_metrics = RequestMetrics()
+
+# cProfile can only run one profiler at a time, so sampled requests take turns
+_profile_lock = threading.Lock()
+
+# The start time lives on the execution context, which is discarded with the
+# statement, so a statement that fails (and never reaches after_cursor_execute)
+# leaves nothing behind on the pooled connection
+def _sql_started(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+def _sql_finished(conn, cursor, statement, parameters, context, executemany):
+    started = context._query_start
+    # QR workers and CLI scripts run outside requests and are not tracked
+    if has_request_context() and 'metrics' in g:
+        g.metrics['queries'] += 1
+        g.metrics['sql_seconds'] += time.perf_counter() - started
+
+def init_profiling(app):
+    """Registers the engine and request hooks that feed request_metrics."""
+    if not event.contains(Engine, 'before_cursor_execute', _sql_started):
+        event.listen(Engine, 'before_cursor_execute', _sql_started)
+        event.listen(Engine, 'after_cursor_execute', _sql_finished)
+
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics = {'start': time.perf_counter(), 'queries': 0, 'sql_seconds': 0.0, 'status': 500, 'profiler': None}
+        if random.random() < app.config['PROFILE_SAMPLE_RATE'] and _profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiling tool (e.g. a debugger) already owns the hook
+                _profile_lock.release()
+            else:
+                g.metrics['profiler'] = profiler
+
+    @app.after_request
+    def _note_status(response):
+        if 'metrics' in g:
+            g.metrics['status'] = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_request_metrics(exc):
+        m = g.pop('metrics', None)
+        if m is None:
+            return
+        seconds = time.perf_counter() - m['start']
+        slow = seconds * 1000 >= app.config['PROFILE_SLOW_MS']
+        endpoint = request.endpoint or 'unmatched'
+
+        profiler = m['profiler']
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+            if slow:
+                out = StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(30)
+                request_metrics.add_profile(endpoint, request.full_path, seconds, out.getvalue())
+
+        if slow:
+            app.logger.warning(
+                "Slow request %s %s: %.0f ms, %d queries (%.0f ms SQL)",
+                request.method, request.path, seconds * 1000, m['queries'], m['sql_seconds'] * 1000
+            )
+        request_metrics.record(endpoint, request.method, m['status'], seconds, m['queries'], m['sql_seconds'], slow)
+
 # ========================
 # APPLICATION FACTORY
 # ========================
@@ -176,18 +2415,79 @@ def create_app():
     # make datetime available in jinja templates if needed
     from datetime import datetime as dt
     app.jinja_env.globals['datetime'] = dt
+    app.jinja_env.globals['ist_now'] = ist_now
 
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'replace-this')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(BASE_DIR, 'roadkill.db'))
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    facet_cache.configure(
+        ttl=int(os.environ.get('FACET_CACHE_TTL', 300)),
+        path=os.environ.get('FACET_CACHE_FILE')
+    )
+    user_cache.configure(
+        ttl=int(os.environ.get('USER_CACHE_TTL', 30)),
+        path=os.environ.get('USER_CACHE_STAMP_FILE')
+    )
+    app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+    app.config['CARCASS_CODE_POOL_BATCH'] = int(os.environ.get('CARCASS_CODE_POOL_BATCH', 1000))
+    app.config['CARCASS_CODE_MAX_FILL'] = float(os.environ.get('CARCASS_CODE_MAX_FILL', 0.5))
+    app.config['IMPORT_CHUNK_SIZE'] = int(os.environ.get('IMPORT_CHUNK_SIZE', 500))
+    app.config['SYNC_PAGE_SIZE'] = int(os.environ.get('SYNC_PAGE_SIZE', 500))
+    app.config['SEARCH_PAGE_SIZE'] = int(os.environ.get('SEARCH_PAGE_SIZE', 50))
+    app.config['SEARCH_COUNT_CAP'] = int(os.environ.get('SEARCH_COUNT_CAP', 1000))
+    app.config['MAP_MAX_FEATURES'] = int(os.environ.get('MAP_MAX_FEATURES', 5000))
+    app.config['MAP_CLUSTER_MAX_ZOOM'] = int(os.environ.get('MAP_CLUSTER_MAX_ZOOM', 10))
+    app.config['MAP_CLUSTER_CELL_PX'] = int(os.environ.get('MAP_CLUSTER_CELL_PX', 60))
+    # Heat layer: grid cell size in screen pixels, kernel bandwidth in cells,
+    # largest grid computed per request, and the cutoff (fraction of the peak)
+    # below which cells are left out of the response
+    app.config['HEAT_CELL_PX'] = int(os.environ.get('HEAT_CELL_PX', 16))
+    app.config['HEAT_BANDWIDTH'] = float(os.environ.get('HEAT_BANDWIDTH', 1.5))
+    app.config['HEAT_MAX_CELLS'] = int(os.environ.get('HEAT_MAX_CELLS', 250000))
+    app.config['HEAT_MIN_DENSITY'] = float(os.environ.get('HEAT_MIN_DENSITY', 0.02))
+    # Road hotspots: segment length, how far off the road a carcass may lie
+    # and still count, sliding window width (segments) and significance level
+    app.config['ROAD_GEOMETRY_PATH'] = os.environ.get('ROAD_GEOMETRY_PATH', os.path.join(BASE_DIR, 'roads.geojson'))
+    app.config['HOTSPOT_SEGMENT_M'] = float(os.environ.get('HOTSPOT_SEGMENT_M', 500))
+    app.config['HOTSPOT_SNAP_M'] = float(os.environ.get('HOTSPOT_SNAP_M', 250))
+    app.config['HOTSPOT_WINDOW'] = int(os.environ.get('HOTSPOT_WINDOW', 3))
+    app.config['HOTSPOT_ALPHA'] = float(os.environ.get('HOTSPOT_ALPHA', 0.05))
 
     label_dir = os.path.join(BASE_DIR, 'static', 'labels')
     os.makedirs(label_dir, exist_ok=True)
     app.config['LABEL_DIR'] = label_dir
+    app.config['QR_ASYNC'] = os.environ.get('QR_ASYNC', '1') == '1'
+    app.config['QR_WORKERS'] = int(os.environ.get('QR_WORKERS', 2))
+    app.config['QR_BATCH_SIZE'] = int(os.environ.get('QR_BATCH_SIZE', 50))
+    app.config['QR_DISK_CACHE'] = os.environ.get('QR_DISK_CACHE', '1') == '1'
+    qr_png_cache.maxsize = int(os.environ.get('QR_CACHE_SIZE', 1024))
+    # Rendered read-only pages kept in process; 0 leaves only the ETag check
+    fragment_cache.maxsize = int(os.environ.get('FRAGMENT_CACHE_SIZE', 0))
+    app.config['LABEL_SHEET_COLS'] = int(os.environ.get('LABEL_SHEET_COLS', 3))
+    app.config['LABEL_SHEET_ROWS'] = int(os.environ.get('LABEL_SHEET_ROWS', 8))
+    app.config['LABEL_SHEET_DPI'] = int(os.environ.get('LABEL_SHEET_DPI', 150))
+
+    # Request profiling: off by default; slow threshold, share of requests
+    # run under cProfile, and a bearer token that lets scrapers skip login
+    app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', '0') == '1'
+    app.config['PROFILE_SLOW_MS'] = float(os.environ.get('PROFILE_SLOW_MS', 500))
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.05))
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+
+    # Password hashing: 'bcrypt' or 'pbkdf2', the cost for each, and how many
+    # hashes a worker process computes at once
+    app.config['PASSWORD_HASH_ALGORITHM'] = os.environ.get('PASSWORD_HASH_ALGORITHM', 'bcrypt')
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    app.config['PBKDF2_ITERATIONS'] = int(os.environ.get('PBKDF2_ITERATIONS', 600000))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    if app.config['PASSWORD_HASH_ALGORITHM'] not in ('bcrypt', 'pbkdf2'):
+        raise ValueError("PASSWORD_HASH_ALGORITHM must be 'bcrypt' or 'pbkdf2'")
 
     db.init_app(app)
     bcrypt.init_app(app)
     login_manager.init_app(app)
+    if app.config['PROFILING_ENABLED']:
+        init_profiling(app)
 
     register_routes(app)
     app.jinja_env.globals['is_admin'] = is_admin
@@ -207,10 +2507,10 @@ def register_routes(app):
     # ---------------- HOME ----------------
     @app.route('/')
     def index():
-        sites = Site.query.all()
+        sites = sites_with_counts()
         # Fetch dynamic lists for the search dropdowns
-        all_species = sorted([r[0] for r in db.session.query(Carcass.species).distinct().filter(Carcass.species.isnot(None)).all()])
-        all_sample_types = sorted([r[0] for r in db.session.query(Sample.sample_type).distinct().filter(Sample.sample_type.isnot(None)).all()])
+        all_species = facet_cache.get('species')
+        all_sample_types = facet_cache.get('sample_types')
         
         return render_template('index.html', sites=sites, all_species=all_species, all_sample_types=all_sample_types)
 
@@ -220,6 +2520,10 @@ def register_routes(app):
     def search_labels():
         species = request.args.get('species', '')
         sample_type = request.args.get('sample_type', '')
+        cursor = request.args.get('cursor', '')
+        per_page = max(1, min(
+            request.args.get('per_page', current_app.config['SEARCH_PAGE_SIZE'], type=int), 500
+        ))
         
         # Start a query joining Sample to Carcass so we can filter by Carcass.species
         query = Sample.query.join(Carcass)
@@ -228,14 +2532,30 @@ def register_routes(app):
             query = query.filter(Carcass.species == species)
         if sample_type:
             query = query.filter(Sample.sample_type == sample_type)
+
+        total, total_capped = bounded_count(query, current_app.config['SEARCH_COUNT_CAP'])
+
+        # Keyset pagination on (collected_at, id), newest first
+        if cursor:
+            query = query.filter(after_sample_cursor(*decode_cursor(cursor)))
             
-        # Execute the search
-        matching_samples = query.order_by(Sample.collected_at.desc()).all()
+        # Execute the search, reusing the join to populate s.carcass
+        page = (
+            query.options(contains_eager(Sample.carcass))
+            .order_by(Sample.collected_at.desc().nulls_last(), Sample.id.desc())
+            .limit(per_page + 1)
+            .all()
+        )
+        matching_samples = page[:per_page]
+        next_cursor = None
+        if len(page) > per_page:
+            last = matching_samples[-1]
+            next_cursor = encode_cursor(last.collected_at, last.id)
         
         # Re-fetch context for the dashboard
-        sites = Site.query.all()
-        all_species = sorted([r[0] for r in db.session.query(Carcass.species).distinct().filter(Carcass.species.isnot(None)).all()])
-        all_sample_types = sorted([r[0] for r in db.session.query(Sample.sample_type).distinct().filter(Sample.sample_type.isnot(None)).all()])
+        sites = sites_with_counts()
+        all_species = facet_cache.get('species')
+        all_sample_types = facet_cache.get('sample_types')
         
         return render_template(
             'index.html', 
@@ -243,10 +2563,31 @@ def register_routes(app):
             all_species=all_species, 
             all_sample_types=all_sample_types,
             label_results=matching_samples,
+            label_total=total,
+            label_total_capped=total_capped,
+            next_cursor=next_cursor,
+            is_first_page=not cursor,
+            per_page=per_page,
             selected_species=species,
             selected_type=sample_type
         )
 
+    # ---------------- FULL-TEXT SEARCH ----------------
+    @app.route('/search')
+    @login_required
+    def search_text():
+        q = request.args.get('q', '').strip()
+        results = search_samples(q, current_app.config['SEARCH_PAGE_SIZE'])
+
+        return render_template(
+            'index.html',
+            sites=sites_with_counts(),
+            all_species=facet_cache.get('species'),
+            all_sample_types=facet_cache.get('sample_types'),
+            text_results=results,
+            text_query=q
+        )
+
     # ---------------- RESET ADMIN PW (utility) ----------------
     @app.route('/reset_admin_pw')
     def reset_admin_pw():
@@ -255,8 +2596,9 @@ def register_routes(app):
             return "Admin user not found."
 
         new_pw = "admin123"
-        admin.pw_hash = bcrypt.generate_password_hash(new_pw).decode("utf-8")
+        admin.pw_hash = hash_password(new_pw)
         db.session.commit()
+        user_cache.invalidate(admin.id)
         return "Admin password reset to: admin123"
 
     # ---------------- LOGIN ----------------
@@ -275,7 +2617,12 @@ def register_routes(app):
                 flash("Your account is pending admin approval.")
                 return redirect(url_for('login'))
 
-            if bcrypt.check_password_hash(user.pw_hash, pw):
+            if verify_password(user.pw_hash, pw):
+                # Move the stored hash onto the current algorithm and cost
+                if password_needs_rehash(user.pw_hash):
+                    user.pw_hash = hash_password(pw)
+                    db.session.commit()
+                    user_cache.invalidate(user.id)
                 login_user(user)
                 return redirect(url_for('index'))
 
@@ -294,10 +2641,9 @@ def register_routes(app):
                 flash("Username already exists")
                 return redirect(url_for('register'))
 
-            hashed = bcrypt.generate_password_hash(pw).decode("utf-8")
             user = User(
                 username=u,
-                pw_hash=hashed,
+                pw_hash=hash_password(pw),
                 full_name=request.form.get('full_name'),
                 is_approved=False
             )
@@ -326,7 +2672,7 @@ def register_routes(app):
             new = request.form.get('new_password')
             conf = request.form.get('confirm_password')
 
-            if not bcrypt.check_password_hash(current_user.pw_hash, cur):
+            if not verify_password(current_user.pw_hash, cur):
                 flash("Current password incorrect.")
                 return redirect(url_for('change_password'))
 
@@ -334,8 +2680,9 @@ def register_routes(app):
                 flash("New passwords do not match.")
                 return redirect(url_for('change_password'))
 
-            current_user.pw_hash = bcrypt.generate_password_hash(new).decode("utf-8")
+            current_user.pw_hash = hash_password(new)
             db.session.commit()
+            user_cache.invalidate(current_user.id)
 
             flash("Password updated.")
             return redirect(url_for('index'))
@@ -350,17 +2697,57 @@ def register_routes(app):
             flash("Admin access required.")
             return redirect(url_for('index'))
 
+        stats = read_statistics()
+        totals = stats['totals']
+        site_codes = dict(db.session.query(Site.id, Site.code))
+
         return render_template(
             'admin_dashboard.html',
-            total_users=User.query.count(),
-            pending_users=User.query.filter_by(is_approved=False).count(),
-            total_sites=Site.query.count(),
-            total_carcasses=Carcass.query.count(),
-            total_samples=Sample.query.count(),
-            recent_carcasses=Carcass.query.order_by(Carcass.datetime_found.desc()).limit(5).all(),
-            recent_samples=Sample.query.order_by(Sample.collected_at.desc()).limit(5).all()
+            total_users=totals.get('users', 0),
+            pending_users=totals.get('users_pending', 0),
+            total_sites=totals.get('sites', 0),
+            total_carcasses=totals.get('carcasses', 0),
+            total_samples=totals.get('samples', 0),
+            by_site=sorted(
+                ((site_codes.get(int(k), k), v) for k, v in stats['site'].items()),
+                key=lambda kv: -kv[1]
+            ),
+            by_species=sorted(stats['species'].items(), key=lambda kv: -kv[1])[:15],
+            by_month=sorted(stats['month'].items())[-12:],
+            code_usage=carcass_code_usage(),
+            recent_carcasses=Carcass.query.options(joinedload(Carcass.site)).order_by(Carcass.datetime_found.desc()).limit(5).all(),
+            recent_samples=Sample.query.options(joinedload(Sample.carcass)).order_by(Sample.collected_at.desc()).limit(5).all()
         )
 
+    # ---------------- METRICS ----------------
+    def metrics_allowed():
+        token = current_app.config['METRICS_TOKEN']
+        if token and request.headers.get('Authorization') == f"Bearer {token}":
+            return True
+        return is_admin()
+
+    @app.route('/admin/metrics')
+    def metrics():
+        if not current_app.config['PROFILING_ENABLED']:
+            abort(404)
+        if not metrics_allowed():
+            abort(403)
+        return Response(request_metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/admin/metrics/profiles')
+    def metrics_profiles():
+        if not current_app.config['PROFILING_ENABLED']:
+            abort(404)
+        if not metrics_allowed():
+            abort(403)
+        with request_metrics.lock:
+            profiles = list(request_metrics.profiles)
+        body = "\n\n".join(
+            f"=== {p['at']:%Y-%m-%d %H:%M:%S} {p['endpoint']} {p['path']} {p['seconds'] * 1000:.0f} ms ===\n{p['stats']}"
+            for p in reversed(profiles)
+        )
+        return Response(body or "No slow requests profiled yet.\n", mimetype='text/plain')
+
     # ---------------- MANAGE USERS ----------------
     @app.route('/admin/users')
     @login_required
@@ -381,6 +2768,7 @@ def register_routes(app):
         u = User.query.get_or_404(user_id)
         u.is_approved = True
         db.session.commit()
+        user_cache.invalidate(u.id)
 
         flash(f"User {u.username} approved.")
         return redirect(url_for('manage_users'))
@@ -396,8 +2784,10 @@ def register_routes(app):
         if u.username == 'admin':
             flash('Cannot delete the admin account.')
             return redirect(url_for('manage_users'))
+        user_id = u.id
         db.session.delete(u)
         db.session.commit()
+        user_cache.invalidate(user_id)
         flash(f'User {u.username} deleted.')
         return redirect(url_for('manage_users'))
 
@@ -415,8 +2805,9 @@ def register_routes(app):
             flash('Password cannot be empty.')
             return redirect(url_for('manage_users'))
 
-        u.pw_hash = bcrypt.generate_password_hash(new_pw).decode('utf-8')
+        u.pw_hash = hash_password(new_pw)
         db.session.commit()
+        user_cache.invalidate(u.id)
         flash(f'Password for {u.username} has been reset.')
         return redirect(url_for('manage_users'))
 
@@ -439,6 +2830,7 @@ def register_routes(app):
             site = Site(name=name, code=code, description=request.form.get('description'))
             db.session.add(site)
             db.session.commit()
+            facet_cache.add('site_codes', code)
 
             flash("Site added.")
             return redirect(url_for('index'))
@@ -449,15 +2841,22 @@ def register_routes(app):
     @app.route('/site/<int:site_id>')
     @login_required
     def view_site(site_id):
-        site = Site.query.get_or_404(site_id)
-        carcasses = (
-            Carcass.query
-            .filter_by(site_id=site_id)
-            .order_by(Carcass.datetime_found.desc())
-            .all()
-        )
+        version = db.session.query(Site.version).filter_by(id=site_id).first()
+        if version is None:
+            abort(404)
+        etag = page_etag(version[0], children_version(Carcass, Carcass.site_id == site_id))
+
+        def render():
+            site = db.session.get(Site, site_id)
+            carcasses = (
+                Carcass.query
+                .filter_by(site_id=site_id)
+                .order_by(Carcass.datetime_found.desc())
+                .all()
+            )
+            return render_template('view_site.html', site=site, carcasses=carcasses)
 
-        return render_template('view_site.html', site=site, carcasses=carcasses)
+        return conditional_page(etag, render)
 
    # ---------------- NEW CARCASS ----------------
     @app.route('/carcass/new', methods=['GET', 'POST'])
@@ -481,6 +2880,12 @@ def register_routes(app):
             dt = request.form.get('datetime')
             dt_obj = datetime.fromisoformat(dt) if dt else ist_now()
 
+            try:
+                lat, lon = parse_coordinates(request.form.get('latitude'), request.form.get('longitude'))
+            except ValueError:
+                flash("Latitude and longitude must be valid decimal degrees.")
+                return redirect(url_for('new_carcass', site_id=site_id))
+
             carcass = Carcass(
                 code=generate_unique_carcass_code(),
                 site_id=site_id,
@@ -489,23 +2894,109 @@ def register_routes(app):
                 species=species,
                 encounter_type=encounter_type,  # <-- Added this field
                 datetime_found=dt_obj,
-                latitude=request.form.get('latitude'),
-                longitude=request.form.get('longitude'),
+                latitude=lat,
+                longitude=lon,
                 notes=request.form.get('notes')
             )
             db.session.add(carcass)
             db.session.commit()
+            facet_cache.add('species', species)
+            facet_cache.add('animal_types', animal_type)
 
             flash("Animal encounter recorded successfully.")
             return redirect(url_for('view_carcass', carcass_id=carcass.id))
 
         return render_template('new_carcass.html', sites=Site.query.all(), site_id=site_id)
 
+    # ---------------- BULK IMPORT ----------------
+    @app.route('/import', methods=['GET', 'POST'])
+    @login_required
+    def import_records():
+        if not is_admin():
+            flash("Admin access required.")
+            return redirect(url_for('index'))
+
+        result = None
+        if request.method == 'POST':
+            upload = request.files.get('file')
+            if not upload or not upload.filename:
+                flash("Choose a CSV file to import.")
+                return redirect(url_for('import_records'))
+
+            stream = TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+            result = import_csv(stream, reporter=current_user, chunk_size=current_app.config['IMPORT_CHUNK_SIZE'])
+            flash(f"Imported {result['carcasses']} encounters and {result['samples']} samples.")
+
+        return render_template('import.html', result=result, columns=IMPORT_COLUMNS)
+
+    # ---------------- FIELD SYNC API ----------------
+    @app.route('/api/sync', methods=['POST'])
+    @login_required
+    def sync_api():
+        body = request.get_data()
+        try:
+            if request.headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            payload = json.loads(body or b'{}')
+        except (OSError, EOFError, ValueError):
+            abort(400, description="Body must be JSON, gzipped if Content-Encoding says so")
+        if not isinstance(payload, dict):
+            abort(400, description="Body must be a JSON object")
+        for key in ('carcasses', 'samples'):
+            items = payload.get(key) or []
+            if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+                abort(400, description=f"'{key}' must be a list of objects")
+
+        try:
+            if payload.get('cursor'):
+                positions = decode_sync_cursor(str(payload['cursor']))
+            else:
+                # A bare 'since' timestamp resumes at or after it in both tables
+                since = _parse_dt(payload.get('since'))
+                positions = [(since, 0), (since, 0)] if since else [None, None]
+        except (ValueError, TypeError):
+            abort(400, description="Body must have a valid 'cursor' or an ISO 'since'")
+
+        try:
+            result = apply_sync_upload(payload, current_user)
+        except IntegrityError:
+            # A concurrent replay of the same upload inserted these uuids
+            # first; applying it again now finds and returns those rows
+            db.session.rollback()
+            try:
+                result = apply_sync_upload(payload, current_user)
+            except IntegrityError:
+                db.session.rollback()
+                abort(409, description="Upload conflicts with a concurrent one; retry")
+        result['changes'] = sync_changes_since(positions, current_app.config['SYNC_PAGE_SIZE'])
+
+        data = json.dumps(result).encode('utf-8')
+        resp = Response(data, mimetype='application/json')
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            resp.set_data(gzip.compress(data))
+            resp.headers['Content-Encoding'] = 'gzip'
+        resp.vary.add('Accept-Encoding')
+        return resp
+
     # ---------------- VIEW CARCASS ----------------
     @app.route('/carcass/<int:carcass_id>')
     def view_carcass(carcass_id):
-        carcass = Carcass.query.get_or_404(carcass_id)
-        return render_template('carcass.html', c=carcass)
+        # The page also shows the reporter's name and every sample
+        row = (
+            db.session.query(Carcass.version, User.username)
+            .outerjoin(User, Carcass.reporter_id == User.id)
+            .filter(Carcass.id == carcass_id)
+            .first()
+        )
+        if row is None:
+            abort(404)
+        etag = page_etag(tuple(row), children_version(Sample, Sample.carcass_id == carcass_id))
+
+        def render():
+            carcass = db.session.get(Carcass, carcass_id)
+            return render_template('carcass.html', c=carcass)
+
+        return conditional_page(etag, render)
 
     # ---------------- NEW SAMPLE ----------------
     @app.route('/carcass/<int:carcass_id>/sample/new', methods=['GET', 'POST'])
@@ -525,7 +3016,6 @@ def register_routes(app):
             seq = next_sequence_for_site_date(c.site.code, collected_at.strftime('%Y%m%d'))
             label = make_label(c.site.code, collected_at, seq, sample_type)
             suid = str(uuid.uuid4())
-            qr_path = generate_qr_for_label(label)
 
             sample = Sample(
                 carcass_id=carcass_id,
@@ -535,11 +3025,12 @@ def register_routes(app):
                 collected_by=current_user.username,
                 collected_at=collected_at,
                 storage=request.form.get('storage'),
-                notes=request.form.get('notes'),
-                qr_path=qr_path
+                notes=request.form.get('notes')
             )
             db.session.add(sample)
             db.session.commit()
+            enqueue_qr_jobs([sample.id])
+            facet_cache.add('sample_types', sample_type)
 
             flash(f"Sample {label} created.")
 
@@ -556,43 +3047,173 @@ def register_routes(app):
     @app.route('/sample/<int:sample_id>')
     @login_required
     def view_sample(sample_id):
-        sample = Sample.query.get_or_404(sample_id)
-        return render_template('sample.html', s=sample)
+        row = (
+            db.session.query(Sample.version, Carcass.version)
+            .outerjoin(Carcass, Sample.carcass_id == Carcass.id)
+            .filter(Sample.id == sample_id)
+            .first()
+        )
+        if row is None:
+            abort(404)
+        etag = page_etag(tuple(row))
+
+        def render():
+            sample = db.session.get(Sample, sample_id)
+            return render_template('sample.html', s=sample)
+
+        return conditional_page(etag, render)
+
+    # ---------------- QR IMAGE ----------------
+    @app.route('/sample/<int:sample_id>/qr.png')
+    def sample_qr(sample_id):
+        label = db.session.query(Sample.label).filter_by(id=sample_id).scalar()
+        if label is None:
+            abort(404)
+
+        # The PNG is a pure function of the label, so the ETag can be checked
+        # before anything is rendered or read from disk
+        etag = qr_etag(label)
+        if etag in request.if_none_match:
+            resp = Response(status=304)
+        else:
+            resp = Response(qr_png_bytes(label), mimetype='image/png')
+
+        resp.set_etag(etag)
+        resp.cache_control.public = True
+        resp.cache_control.max_age = 31536000
+        resp.cache_control.immutable = True
+        return resp
+
+    # ---------------- BATCH QR RENDER ----------------
+    @app.route('/samples/qr/render', methods=['POST'])
+    @login_required
+    def render_sample_qrs():
+        # Accepts sample_ids (repeated or comma-separated) and/or a carcass_id
+        ids = set()
+        for value in request.values.getlist('sample_ids'):
+            ids.update(int(v) for v in value.split(',') if v.strip().isdigit())
 
-    # ---------------- EXPORT ----------------
-    @app.route('/samples/export')
+        carcass_id = request.values.get('carcass_id', type=int)
+        if carcass_id:
+            ids.update(r[0] for r in db.session.query(Sample.id).filter_by(carcass_id=carcass_id))
+
+        enqueue_qr_jobs(sorted(ids))
+        return jsonify({"queued": len(ids), "async": current_app.config['QR_ASYNC']}), 202
+
+    # ---------------- LABEL SHEETS ----------------
+    @app.route('/labels/sheet')
     @login_required
-    def export_samples():
-        samples = Sample.query.all()
+    def label_sheet():
+        # Select by carcass_id, site_id (+ date_from/date_to), or sample_ids
+        query = Sample.query.options(joinedload(Sample.carcass))
+        selected = False
 
-        si = StringIO()
-        cw = csv.writer(si)
+        carcass_id = request.args.get('carcass_id', type=int)
+        if carcass_id:
+            query = query.filter(Sample.carcass_id == carcass_id)
+            selected = True
 
-        cw.writerow([
-            'label', 'uuid', 'sample_type', 'collected_by', 'collected_at_IST',
-            'storage', 'notes', 'carcass_id', 'carcass_code', 'site_code', 'species'
-        ])
+        site_id = request.args.get('site_id', type=int)
+        if site_id:
+            query = query.join(Carcass).filter(Carcass.site_id == site_id)
+            selected = True
+            date_from = request.args.get('date_from')
+            if date_from:
+                query = query.filter(Sample.collected_at >= parse_date_arg(date_from, 'date_from'))
+            date_to = request.args.get('date_to')
+            if date_to:
+                query = query.filter(Sample.collected_at < parse_date_arg(date_to, 'date_to') + timedelta(days=1))
+
+        sample_ids = request.args.get('sample_ids', '')
+        if sample_ids:
+            ids = [int(v) for v in sample_ids.split(',') if v.strip().isdigit()]
+            query = query.filter(Sample.id.in_(ids))
+            selected = True
+
+        if not selected:
+            abort(400, description="Give carcass_id, site_id or sample_ids")
+
+        cols = current_app.config['LABEL_SHEET_COLS']
+        rows = current_app.config['LABEL_SHEET_ROWS']
+        dpi = current_app.config['LABEL_SHEET_DPI']
+        per_page = cols * rows
+        stamp = ist_now().strftime('%Y%m%d_%H%M')
+
+        if request.args.get('format') == 'png':
+            page_no = max(request.args.get('page', 1, type=int), 1)
+            samples = query.order_by(Sample.id).offset((page_no - 1) * per_page).limit(per_page).all()
+            if not samples:
+                abort(404)
+            page = next(label_sheet_pages(samples, cols, rows, dpi))
+            buf = BytesIO()
+            page.save(buf, format='PNG', dpi=(dpi, dpi))
+            return Response(buf.getvalue(), mimetype='image/png')
+
+        # Checked before streaming starts, when a 404 can still be sent
+        if query.with_entities(Sample.id).limit(1).first() is None:
+            abort(404)
+
+        def generate():
+            pdf = StreamingPdf(dpi)
+            yield pdf.header()
+            samples = iter_keyset(query, Sample.id, per_page)
+            for page in label_sheet_pages(samples, cols, rows, dpi):
+                yield pdf.add_page(page)
+            yield pdf.finish()
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype='application/pdf',
+            headers={'Content-Disposition': f'inline; filename=labels_{stamp}.pdf'}
+        )
 
-        for s in samples:
-            cw.writerow([
-                s.label,
-                s.uuid,
-                s.sample_type,
-                s.collected_by,
-                s.collected_at.strftime('%Y-%m-%d %H:%M:%S') + ' IST',
-                s.storage,
-                s.notes,
-                s.carcass_id,
-                s.carcass.code if s.carcass else '',
-                s.carcass.site.code if s.carcass and s.carcass.site else '',
-                s.carcass.species if s.carcass else ''
-            ])
+    # ---------------- EXPORT ----------------
+    EXPORT_HEADER = [
+        'label', 'uuid', 'sample_type', 'collected_by', 'collected_at_IST',
+        'storage', 'notes', 'carcass_id', 'carcass_code', 'site_code', 'species'
+    ]
 
-        output = BytesIO(si.getvalue().encode('utf-8'))
-        output.seek(0)
+    @app.route('/samples/export')
+    @login_required
+    def export_samples():
+        # Carcass and site are joined into each batch so rows never lazy-load
+        query = Sample.query.options(joinedload(Sample.carcass).joinedload(Carcass.site))
+        batch_size = current_app.config['EXPORT_BATCH_SIZE']
+
+        def generate():
+            si = StringIO()
+            cw = csv.writer(si)
+            cw.writerow(EXPORT_HEADER)
+
+            for i, s in enumerate(iter_keyset(query, Sample.id, batch_size), start=1):
+                cw.writerow([
+                    s.label,
+                    s.uuid,
+                    s.sample_type,
+                    s.collected_by,
+                    s.collected_at.strftime('%Y-%m-%d %H:%M:%S') + ' IST' if s.collected_at else '',
+                    s.storage,
+                    s.notes,
+                    s.carcass_id,
+                    s.carcass.code if s.carcass else '',
+                    s.carcass.site.code if s.carcass and s.carcass.site else '',
+                    s.carcass.species if s.carcass else ''
+                ])
+
+                # Flush one chunk per batch so the worker only ever holds a batch
+                if i % batch_size == 0:
+                    yield si.getvalue()
+                    si.seek(0)
+                    si.truncate(0)
+
+            yield si.getvalue()
 
         filename = f"samples_{ist_now().strftime('%Y%m%d_%H%M')}.csv"
-        return send_file(output, mimetype='text/csv', as_attachment=True, download_name=filename)
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
 
     # ---------------- REVERSE SEARCH BY SUFFIX ----------------
     @app.route('/search_sample')
@@ -619,7 +3240,7 @@ def register_routes(app):
             return redirect(url_for('view_carcass', carcass_id=carcasses[0].id))
             
         # In case of rare randomized collisions, display matching results on the dashboard
-        return render_template('index.html', sites=Site.query.all(), custom_results=carcasses)
+        return render_template('index.html', sites=sites_with_counts(), custom_results=carcasses)
 
 
     # ==========================================
@@ -653,6 +3274,7 @@ def register_routes(app):
             return redirect(url_for('view_site', site_id=site_id))
         db.session.delete(site)
         db.session.commit()
+        facet_cache.invalidate()
         flash(f"Site {site.name} deleted.")
         return redirect(url_for('index'))
 
@@ -666,6 +3288,12 @@ def register_routes(app):
         c = Carcass.query.get_or_404(carcass_id)
         
         if request.method == 'POST':
+            try:
+                lat, lon = parse_coordinates(request.form.get('latitude'), request.form.get('longitude'))
+            except ValueError:
+                flash("Latitude and longitude must be valid decimal degrees.")
+                return redirect(url_for('edit_carcass', carcass_id=carcass_id))
+
             # Extract and Clean Species
             raw_species = (request.form.get('species_custom') if request.form.get('species_select') == 'Other' else request.form.get('species_select'))
             c.species = raw_species.strip().title() if raw_species else None
@@ -674,13 +3302,12 @@ def register_routes(app):
             c.encounter_type = request.form.get('encounter_type')
             
             c.notes = request.form.get('notes')
-            lat = request.form.get('latitude')
-            lon = request.form.get('longitude')
-            if lat and lon:
+            if lat is not None and lon is not None:
                 c.latitude = lat
                 c.longitude = lon
                 
             db.session.commit()
+            facet_cache.invalidate()
             flash(f"Record {c.code} updated.") 
             return redirect(url_for('view_carcass', carcass_id=c.id))
             
@@ -698,6 +3325,7 @@ def register_routes(app):
             return redirect(url_for('view_carcass', carcass_id=carcass_id))
         db.session.delete(c)
         db.session.commit()
+        facet_cache.invalidate()
         flash(f"Carcass {c.code} deleted.")
         return redirect(url_for('view_site', site_id=site_id))
 
@@ -722,6 +3350,7 @@ def register_routes(app):
             s.processing_result = request.form.get('processing_result')
             
             db.session.commit()
+            facet_cache.invalidate()
             flash(f"Sample {s.label} updated.")
             return redirect(url_for('view_sample', sample_id=s.id))
             
@@ -736,41 +3365,205 @@ def register_routes(app):
         carcass_id = s.carcass_id
         db.session.delete(s)
         db.session.commit()
+        facet_cache.invalidate()
         flash(f"Sample {s.label} deleted.")
         return redirect(url_for('view_carcass', carcass_id=carcass_id))
 
 
 
-    # ---------------- MAP VIEW ----------------
     # ---------------- MAP VIEW ----------------
     @app.route('/map')
     def map_view():
-        # 1. Get mappable carcasses for the map
-        carcasses = Carcass.query.filter(
-            Carcass.latitude.isnot(None), 
-            Carcass.longitude.isnot(None)
-        ).all()
-
-        # 2. Get FULL unique lists for the dropdowns
-        all_sites = sorted({s.code for s in Site.query.all()})
-        
-        # Use simple distinct queries
-        all_species = [r[0] for r in db.session.query(Carcass.species).distinct().filter(Carcass.species.isnot(None)).all()]
-        all_types = [r[0] for r in db.session.query(Carcass.animal_type).distinct().filter(Carcass.animal_type.isnot(None)).all()]
-        
-        all_species.sort()
-        all_types.sort()
-
-        return render_template('map.html', 
-                               carcasses=carcasses, 
+        # Points are fetched per viewport from /api/map/carcasses;
+        # the page itself only needs the dropdown vocabularies.
+        all_sites = facet_cache.get('site_codes')
+        all_species = facet_cache.get('species')
+        all_types = facet_cache.get('animal_types')
+        cluster_max_zoom = current_app.config['MAP_CLUSTER_MAX_ZOOM']
+        etag = page_etag(all_sites, all_species, all_types, cluster_max_zoom)
+
+        return conditional_page(etag, lambda: render_template('map.html', 
                                all_sites=all_sites, 
                                all_species=all_species, 
-                               all_types=all_types)
+                               all_types=all_types,
+                               cluster_max_zoom=cluster_max_zoom))
+
+    # ---------------- MAP DATA API ----------------
+    @app.route('/api/map/carcasses')
+    def map_carcasses_api():
+        query = db.session.query(
+            Carcass.id, Carcass.code, Carcass.species, Carcass.animal_type,
+            Carcass.latitude, Carcass.longitude, Carcass.datetime_found,
+            Site.code.label('site_code')
+        ).outerjoin(Site, Carcass.site_id == Site.id)
+        query = filter_map_carcasses(query, request.args)
+
+        limit = current_app.config['MAP_MAX_FEATURES']
+        rows = query.order_by(Carcass.datetime_found.desc()).limit(limit + 1).all()
+        truncated = len(rows) > limit
+
+        features = [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [r.longitude, r.latitude]},
+                "properties": {
+                    "id": r.id,
+                    "code": r.code,
+                    "site": r.site_code,
+                    "species": r.species,
+                    "type": r.animal_type,
+                    "date": r.datetime_found.strftime('%Y-%m-%d') if r.datetime_found else None,
+                    "link": url_for('view_carcass', carcass_id=r.id)
+                }
+            }
+            for r in rows[:limit]
+        ]
+
+        return jsonify({"type": "FeatureCollection", "features": features, "truncated": truncated})
+
+    @app.route('/api/map/clusters')
+    def map_clusters_api():
+        zoom = max(0, min(request.args.get('zoom', 5, type=int), 22))
+        size = cluster_cell_size(zoom)
+
+        cy = grid_cell(Carcass.latitude, -90, size).label('cy')
+        cx = grid_cell(Carcass.longitude, -180, size).label('cx')
+        query = db.session.query(
+            cy, cx, Carcass.animal_type,
+            func.count(Carcass.id).label('n'),
+            func.avg(Carcass.latitude).label('lat'),
+            func.avg(Carcass.longitude).label('lng')
+        ).outerjoin(Site, Carcass.site_id == Site.id)
+        query = filter_map_carcasses(query, request.args)
+        rows = query.group_by(cy, cx, Carcass.animal_type).all()
+
+        # Fold the per-type rows of each cell into one cluster with a breakdown
+        cells = {}
+        for r in rows:
+            cell = cells.setdefault((r.cy, r.cx), {"count": 0, "lat": 0.0, "lng": 0.0, "types": {}})
+            cell["count"] += r.n
+            cell["lat"] += r.lat * r.n
+            cell["lng"] += r.lng * r.n
+            cell["types"][r.animal_type or "Unknown"] = r.n
+
+        clusters = [
+            {
+                "lat": cell["lat"] / cell["count"],
+                "lng": cell["lng"] / cell["count"],
+                "count": cell["count"],
+                "types": cell["types"]
+            }
+            for cell in cells.values()
+        ]
+
+        return jsonify({"zoom": zoom, "cell_size": size, "clusters": clusters})
+
+    # ---------------- ANALYTICS API ----------------
+    @app.route('/api/analytics/rollups')
+    @login_required
+    def analytics_rollups():
+        period = request.args.get('period', 'month')
+        dimension = request.args.get('dimension', 'all')
+        if period not in ROLLUP_PERIODS or dimension not in ROLLUP_DIMENSIONS:
+            abort(400, description="period must be one of day/week/month and dimension one of " + "/".join(ROLLUP_DIMENSIONS))
+
+        start = request.args.get('date_from')
+        end = request.args.get('date_to')
+        if start:
+            start = period_start(parse_date_arg(start, 'date_from'), period).isoformat()
+        if end:
+            end = parse_date_arg(end, 'date_to').date().isoformat()
+
+        series = encounter_series(period, dimension, start, end)
+        if dimension == 'site':
+            codes = dict(db.session.query(Site.id, Site.code))
+            series = {codes.get(int(k), k): v for k, v in series.items()}
+
+        return jsonify({
+            "period": period,
+            "dimension": dimension,
+            "series": {k: [{"bucket": b, "count": n} for b, n in v] for k, v in series.items()}
+        })
+
+    @app.route('/api/analytics/segments')
+    def analytics_segments():
+        """Ranked road segments as GeoJSON from the cached results; hotspots only unless all=1."""
+        query = Site.query
+        if request.args.get('site'):
+            query = query.filter(Site.code == request.args['site'])
+        sites = {s.id: s for s in query}
+        roads = road_network()
+
+        stats = RoadSegmentStat.query.filter(RoadSegmentStat.site_id.in_(list(sites)))
+        if request.args.get('all') != '1':
+            stats = stats.filter(RoadSegmentStat.is_hotspot.is_(True))
+        limit = min(request.args.get('limit', 200, type=int), 5000)
+        stats = stats.order_by(RoadSegmentStat.site_id, RoadSegmentStat.rank).limit(limit)
+
+        segment_m = current_app.config['HOTSPOT_SEGMENT_M']
+        features = []
+        for st in stats:
+            site = sites[st.site_id]
+            road = roads.get(site.code.upper())
+            start_m = st.segment * segment_m
+            # Segments cached for an older, longer geometry wait for the next refresh
+            if road is None or start_m >= road.total_m:
+                continue
+            end_m = min(start_m + segment_m, road.total_m)
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "MultiLineString", "coordinates": road.slice(start_m, end_m)},
+                "properties": {
+                    "site": site.code,
+                    "segment": st.segment,
+                    "rank": st.rank,
+                    "start_m": round(start_m),
+                    "end_m": round(end_m),
+                    "count": st.count,
+                    "window_count": st.window_count,
+                    "expected": round(st.expected, 3),
+                    "p_value": st.p_value,
+                    "hotspot": st.is_hotspot
+                }
+            })
+
+        return jsonify({"type": "FeatureCollection", "features": features})
+
+    @app.route('/api/analytics/hotspots')
+    def analytics_hotspots():
+        cfg = current_app.config
+        zoom = max(0, min(request.args.get('zoom', 5, type=int), 22))
+        degrees_per_px = 360.0 / (2 ** zoom) / 256.0
+        size = max(HOTSPOT_CELL_DEG, degrees_per_px * cfg['HEAT_CELL_PX'])
+
+        lat, lng, counts = hotspot_points(request.args)
+        if not len(counts):
+            return jsonify({"zoom": zoom, "total": 0, "cell_size": size, "cell_px": cfg['HEAT_CELL_PX'], "cells": []})
+
+        south, west, size, grid = kernel_density(
+            lat, lng, counts, size, cfg['HEAT_BANDWIDTH'], cfg['HEAT_MAX_CELLS']
+        )
+        grid /= grid.max()
+        iy, ix = np.nonzero(grid >= cfg['HEAT_MIN_DENSITY'])
+        cells = [
+            {"lat": round(south + (y + 0.5) * size, 5), "lng": round(west + (x + 0.5) * size, 5), "density": round(float(grid[y, x]), 3)}
+            for y, x in zip(iy.tolist(), ix.tolist())
+        ]
+
+        return jsonify({
+            "zoom": zoom,
+            "total": int(counts.sum()),
+            "cell_size": size,
+            "cell_px": size / degrees_per_px,
+            "cells": cells
+        })
 
 
 # ========================
 # GUNICORN ENTRYPOINT
 # ========================
+# gunicorn.conf.py preloads this module, so create_app() (and with it the
+# schema setup) runs once in the master before the workers are forked.
 
 app = create_app()
 
@@ -0,0 +1,398 @@
+"""
+Reproducible benchmark for the main routes.
+
+Generates a seeded synthetic dataset shaped like our field data (four
+highway sites, encounters clustered along each road, a long-tailed species
+mix, monsoon-heavy dates, 0-3 samples per carcass), replays scripted
+request scenarios against it and writes a JSON report of latency,
+throughput and SQL query counts that can be diffed across commits.
+
+    python benchmark.py --scale 100k                    # in-process test client
+    python benchmark.py --scale 100k --db /tmp/b.db --generate-only
+    python benchmark.py --db /tmp/b.db --url http://127.0.0.1:8000 --concurrency 8
+    python benchmark.py --scale 1k --compare bench_output.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, build_opener
+
+SCALES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+# Site code, name, road polyline (lng, lat), share of encounters
+SITES = [
+    ("NH44", "NH44 Nagpur - Seoni", [(79.09, 21.15), (79.25, 21.55), (79.42, 21.80), (79.55, 22.08)], 0.40),
+    ("NH46", "NH46 Betul - Obaidullaganj", [(77.90, 21.90), (77.75, 22.40), (77.60, 22.80), (77.55, 23.00)], 0.20),
+    ("NH45", "NH45 Jabalpur - Bhopal", [(79.93, 23.17), (79.40, 23.35), (78.74, 23.84)], 0.20),
+    ("NH23", "NH23 Ranchi - Gumla", [(85.31, 23.34), (84.90, 23.20), (84.54, 23.04)], 0.20),
+]
+
+# Species, animal type, relative frequency
+SPECIES = [
+    ("Jackal", "Wild", 18), ("Dog", "Domestic", 16), ("Indian Palm Civet", "Wild", 10),
+    ("Cattle", "Domestic", 8), ("Russell's Viper", "Wild", 7), ("Spectacled Cobra", "Wild", 6),
+    ("Bengal Monitor", "Wild", 6), ("Common Toad", "Wild", 5), ("Indian Hare", "Wild", 5),
+    ("Jungle Cat", "Wild", 4), ("Spotted Deer", "Wild", 4), ("Nilgai", "Wild", 3),
+    ("Rhesus Macaque", "Wild", 3), ("Cat", "Domestic", 3), ("Wild Boar", "Wild", 2),
+]
+ENCOUNTER_TYPES = [("Roadkill", 92), ("Injured", 5), ("Sighting", 3)]
+SAMPLE_TYPES = [("Tissue", 45), ("Hair", 25), ("Blood", 15), ("Swab", 10), ("Scat", 5)]
+SAMPLES_PER_CARCASS = [0, 1, 1, 2, 2, 3]
+CODE_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+START_DATE = datetime(2023, 1, 1)
+DAYS = 3 * 365
+
+
+def _weighted(rng, choices):
+    return rng.choices([c[0] for c in choices], weights=[c[-1] for c in choices])[0]
+
+
+def _along(route, t):
+    """Point at fraction t along a polyline (by vertex spacing, good enough here)."""
+    pos = t * (len(route) - 1)
+    i = min(int(pos), len(route) - 2)
+    f = pos - i
+    (x0, y0), (x1, y1) = route[i], route[i + 1]
+    return x0 + f * (x1 - x0), y0 + f * (y1 - y0)
+
+
+def generate_rows(n_carcasses, seed):
+    """Yields ('carcass', row) and ('sample', row) dicts; ids are assigned here."""
+    rng = random.Random(seed)
+    hotspots = {code: [rng.random() for _ in range(3)] for code, _, _, _ in SITES}
+    weights = [share for _, _, _, share in SITES]
+    codes, sequences = set(), {}
+    sample_id = 0
+
+    for carcass_id in range(1, n_carcasses + 1):
+        site_index = rng.choices(range(len(SITES)), weights=weights)[0]
+        site_code, _, route, _ = SITES[site_index]
+
+        # A third of encounters fall on a few deadly stretches
+        if rng.random() < 0.35:
+            t = min(max(rng.gauss(rng.choice(hotspots[site_code]), 0.01), 0.0), 1.0)
+        else:
+            t = rng.random()
+        lng, lat = _along(route, t)
+
+        # Monsoon months (Jul-Sep) see roughly twice the traffic
+        while True:
+            found = START_DATE + timedelta(days=rng.randrange(DAYS), minutes=rng.randrange(24 * 60))
+            if found.month in (7, 8, 9) or rng.random() < 0.5:
+                break
+
+        while True:
+            code = ''.join(rng.choice(CODE_CHARS) for _ in range(6))
+            if code not in codes:
+                codes.add(code)
+                break
+
+        species, animal_type = None, None
+        if rng.random() > 0.03:
+            species = _weighted(rng, SPECIES)
+            animal_type = next(t for s, t, _ in SPECIES if s == species)
+
+        yield 'carcass', {
+            'id': carcass_id,
+            'code': code,
+            'uuid': str(uuid.UUID(int=rng.getrandbits(128))),
+            'site_id': site_index + 1,
+            'reporter_id': 1,
+            'species': species,
+            'animal_type': animal_type,
+            'encounter_type': _weighted(rng, ENCOUNTER_TYPES),
+            'datetime_found': found,
+            'latitude': round(lat + rng.gauss(0, 0.0008), 6),
+            'longitude': round(lng + rng.gauss(0, 0.0008), 6),
+            'notes': f"Found near km {t * 100:.1f}" if rng.random() < 0.4 else None,
+            'updated_at': found,
+        }
+
+        for _ in range(rng.choice(SAMPLES_PER_CARCASS)):
+            sample_id += 1
+            sample_type = _weighted(rng, SAMPLE_TYPES)
+            collected = found + timedelta(minutes=rng.randrange(600))
+            date_str = collected.strftime('%Y%m%d')
+            seq = sequences[(site_code, date_str)] = sequences.get((site_code, date_str), 0) + 1
+            label = f"{site_code}-{date_str}-{seq:03d}-{sample_type[:3].upper()}-{rng.getrandbits(16):04X}"
+            yield 'sample', {
+                'id': sample_id,
+                'carcass_id': carcass_id,
+                'uuid': str(uuid.UUID(int=rng.getrandbits(128))),
+                'label': label,
+                'label_suffix': label.rsplit('-', 1)[-1],
+                'sample_type': sample_type,
+                'collected_by': 'admin',
+                'collected_at': collected,
+                'storage': rng.choice(['Freezer A', 'Freezer B', 'Ethanol', None]),
+                'notes': rng.choice(['Fresh', 'Decomposed', 'Flattened', None]),
+                'status': 'Pending',
+                'updated_at': collected,
+            }
+
+
+def populate(n_carcasses, seed, batch_size=10000):
+    """Bulk-loads the synthetic dataset, then rebuilds derived tables."""
+    from app import (
+        db, Site, Carcass, Sample, refresh_statistics, refresh_rollups,
+        search_index_refresh, search_index_ready
+    )
+
+    for code, name, _, _ in SITES:
+        db.session.add(Site(code=code, name=name, description="Synthetic benchmark site"))
+    db.session.commit()
+
+    batches = {'carcass': [], 'sample': []}
+    tables = {'carcass': Carcass.__table__, 'sample': Sample.__table__}
+    for kind, row in generate_rows(n_carcasses, seed):
+        batch = batches[kind]
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(tables[kind].insert(), batch)
+            batch.clear()
+    for kind, batch in batches.items():
+        if batch:
+            db.session.execute(tables[kind].insert(), batch)
+    db.session.commit()
+
+    # Bulk inserts bypass the after_flush hooks, so rebuild what they maintain
+    refresh_statistics()
+    refresh_rollups()
+    conn = db.session.connection()
+    if search_index_ready(conn):
+        search_index_refresh(conn, "1 = 1")
+    db.session.commit()
+
+
+def build_scenarios(ctx):
+    """name -> (method, path builder, form builder or None, default repeats)."""
+    def bbox(rng):
+        lng, lat = _along(rng.choice(SITES)[2], rng.random())
+        return f"{lng - 0.15:.4f},{lat - 0.15:.4f},{lng + 0.15:.4f},{lat + 0.15:.4f}"
+
+    species = [s for s, _, _ in SPECIES]
+    return {
+        'index': ('GET', lambda rng: '/', None, 20),
+        'map_view': ('GET', lambda rng: '/map', None, 20),
+        'map_points': ('GET', lambda rng: '/api/map/carcasses?' + urlencode({'bbox': bbox(rng)}), None, 20),
+        'map_clusters': ('GET', lambda rng: '/api/map/clusters?zoom=6', None, 20),
+        'map_heat': ('GET', lambda rng: '/api/analytics/hotspots?zoom=7', None, 20),
+        'search_labels': ('GET', lambda rng: '/search_labels?' + urlencode({'species': rng.choice(species)}), None, 20),
+        'search_text': ('GET', lambda rng: '/search?' + urlencode({'q': rng.choice(species).split()[-1]}), None, 20),
+        'view_carcass': ('GET', lambda rng: f"/carcass/{rng.randint(1, ctx['carcasses'])}", None, 20),
+        'view_sample': ('GET', lambda rng: f"/sample/{rng.randint(1, max(ctx['samples'], 1))}", None, 20),
+        'new_sample': (
+            'POST', lambda rng: f"/carcass/{rng.randint(1, ctx['carcasses'])}/sample/new",
+            lambda rng: {'sample_type_select': _weighted(rng, SAMPLE_TYPES), 'storage': 'Freezer A', 'notes': 'benchmark'},
+            20
+        ),
+        'admin_dashboard': ('GET', lambda rng: '/admin', None, 20),
+        'export_samples': ('GET', lambda rng: '/samples/export', None, 2),
+    }
+
+
+class TestClientRunner:
+    """Runs requests in-process and counts SQL statements per request."""
+    concurrency = 1
+
+    def __init__(self, app):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        self.client = app.test_client()
+        self.queries = 0
+
+        def count(*args):
+            self.queries += 1
+        event.listen(Engine, 'after_cursor_execute', count)
+
+    def login(self):
+        self.client.post('/login', data={'username': 'admin', 'password': 'admin'})
+
+    def request(self, method, path, form):
+        self.queries = 0
+        started = time.perf_counter()
+        resp = self.client.open(path, method=method, data=form)
+        size = len(resp.get_data())
+        return time.perf_counter() - started, resp.status_code, size, self.queries
+
+
+class HttpRunner:
+    """Runs requests against a live server (e.g. gunicorn); no query counts."""
+
+    def __init__(self, base_url, concurrency):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+
+    def login(self):
+        self.request('POST', '/login', {'username': 'admin', 'password': 'admin'})
+
+    def request(self, method, path, form):
+        data = urlencode(form).encode() if form is not None else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, data=data, timeout=300) as resp:
+                status, size = resp.status, len(resp.read())
+        except HTTPError as e:
+            status, size = e.code, len(e.read())
+        return time.perf_counter() - started, status, size, None
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def run_scenario(runner, method, path_fn, form_fn, repeats, seed):
+    rng = random.Random(seed)
+    calls = [(path_fn(rng), form_fn(rng) if form_fn else None) for _ in range(repeats)]
+
+    started = time.perf_counter()
+    if runner.concurrency > 1:
+        with ThreadPoolExecutor(runner.concurrency) as pool:
+            results = list(pool.map(lambda c: runner.request(method, *c), calls))
+    else:
+        results = [runner.request(method, *c) for c in calls]
+    wall = time.perf_counter() - started
+
+    latencies = [r[0] * 1000 for r in results]
+    queries = [r[3] for r in results if r[3] is not None]
+    return {
+        'requests': len(results),
+        'errors': sum(1 for r in results if r[1] >= 400),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(max(latencies), 2),
+        'throughput_rps': round(len(results) / wall, 2),
+        'bytes_mean': int(sum(r[2] for r in results) / len(results)),
+        'queries_mean': round(sum(queries) / len(queries), 2) if queries else None,
+        'queries_max': max(queries) if queries else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def delta(new, old):
+        if new is None or not old:
+            return '     -'
+        return f"{(new - old) / old * 100:+6.1f}%"
+
+    print(f"\nvs {baseline_path} ({baseline['meta'].get('commit')})")
+    for key in ('scale', 'seed', 'target', 'concurrency'):
+        if baseline['meta'].get(key) != report['meta'][key]:
+            print(f"⚠️  {key} differs: {baseline['meta'].get(key)} vs {report['meta'][key]}")
+    print(f"{'scenario':<18}{'p50 ms':>11}{'Δ':>11}{'p95 ms':>11}{'Δ':>11}{'queries':>11}{'Δ':>11}")
+    for name, new in report['scenarios'].items():
+        old = baseline['scenarios'].get(name, {})
+        print(
+            f"{name:<18}{new['p50_ms']:>11}{delta(new['p50_ms'], old.get('p50_ms')):>11}"
+            f"{new['p95_ms']:>11}{delta(new['p95_ms'], old.get('p95_ms')):>11}"
+            f"{str(new['queries_mean']):>11}{delta(new['queries_mean'], old.get('queries_mean')):>11}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Roadkill routes against a synthetic dataset.")
+    parser.add_argument('--scale', choices=SCALES, default='1k', help="number of carcasses to generate")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', help="SQLite file to build or reuse (default: a temporary file)")
+    parser.add_argument('--generate-only', action='store_true', help="build the dataset and exit")
+    parser.add_argument('--url', help="benchmark a running server instead of the in-process test client")
+    parser.add_argument('--concurrency', type=int, default=1, help="parallel requests (with --url)")
+    parser.add_argument('--repeat', type=int, help="requests per scenario (default: per-scenario)")
+    parser.add_argument('--only', help="comma-separated scenario names")
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--compare', help="earlier report to diff against")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='roadkill-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(db_path)
+    # Render QR codes inline and keep them off disk so runs are repeatable
+    os.environ.setdefault('QR_ASYNC', '0')
+    os.environ.setdefault('QR_DISK_CACHE', '0')
+
+    from app import app, db, Carcass, Sample
+
+    app.config['LABEL_DIR'] = tempfile.mkdtemp(prefix='roadkill-bench-labels-')
+    with app.app_context():
+        if Carcass.query.first() is None:
+            print(f"Generating {args.scale} dataset (seed {args.seed}) in {db_path} ...")
+            started = time.perf_counter()
+            populate(SCALES[args.scale], args.seed)
+            print(f"  done in {time.perf_counter() - started:.1f}s")
+        else:
+            print(f"Reusing existing dataset in {db_path}")
+        ctx = {'carcasses': db.session.query(db.func.max(Carcass.id)).scalar() or 1,
+               'samples': db.session.query(db.func.max(Sample.id)).scalar() or 0}
+    if args.generate_only:
+        return
+
+    runner = HttpRunner(args.url, args.concurrency) if args.url else TestClientRunner(app)
+    runner.login()
+
+    scenarios = build_scenarios(ctx)
+    names = args.only.split(',') if args.only else list(scenarios)
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'scale': args.scale,
+            'seed': args.seed,
+            'carcasses': ctx['carcasses'],
+            'samples': ctx['samples'],
+            'target': args.url or 'test_client',
+            'concurrency': runner.concurrency,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+        },
+        'scenarios': {},
+    }
+
+    print(f"{'scenario':<18}{'req':>5}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'rps':>9}{'queries':>9}")
+    for i, name in enumerate(names):
+        method, path_fn, form_fn, repeats = scenarios[name]
+        result = run_scenario(runner, method, path_fn, form_fn, args.repeat or repeats, args.seed + i)
+        report['scenarios'][name] = result
+        print(
+            f"{name:<18}{result['requests']:>5}{result['errors']:>5}{result['p50_ms']:>10}"
+            f"{result['p95_ms']:>10}{result['throughput_rps']:>9}{str(result['queries_mean']):>9}"
+        )
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
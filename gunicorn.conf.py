@@ -0,0 +1,85 @@
+"""
+Gunicorn settings for production: `gunicorn -c gunicorn.conf.py app:app`.
+
+Workers and threads are sized from the CPUs this process may run on and
+GUNICORN_IO_PROFILE, which says how much of a request is spent waiting on
+the database rather than in Python:
+
+    cpu    one thread per worker, a worker per CPU plus one (QR/label
+           rendering, heat maps and road hotspots dominate)
+    mixed  the default; a few threads per worker to overlap DB waits
+    io     fewer workers, more threads (remote Postgres, slow disks)
+
+WEB_CONCURRENCY and GUNICORN_THREADS override the computed values.
+
+The app is preloaded, so app.py is imported once in the master: schema
+setup and migrations run there before any worker exists, and workers share
+the imported code copy-on-write. Every worker then drops the database
+connections it inherited and opens its own.
+"""
+import os
+import tempfile
+
+
+IO_PROFILES = {
+    # profile: (workers per CPU, extra workers, threads per worker)
+    'cpu': (1, 1, 1),
+    'mixed': (1, 1, 4),
+    'io': (0.5, 1, 8),
+}
+
+
+def available_cpus():
+    # Respects taskset/cgroup CPU pinning, unlike os.cpu_count()
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+io_profile = os.environ.get('GUNICORN_IO_PROFILE', 'mixed')
+if io_profile not in IO_PROFILES:
+    raise ValueError(f"GUNICORN_IO_PROFILE must be one of {', '.join(IO_PROFILES)}")
+per_cpu, extra, profile_threads = IO_PROFILES[io_profile]
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', max(1, int(available_cpus() * per_cpu) + extra)))
+threads = int(os.environ.get('GUNICORN_THREADS', profile_threads))
+preload_app = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then so a slow leak can't grow without bound
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+
+# With several workers, the facet and user caches only see each other's
+# writes within their TTLs unless they share a stamp file
+if workers > 1:
+    cache_dir = tempfile.mkdtemp(prefix='roadkill-')
+    os.environ.setdefault('FACET_CACHE_FILE', os.path.join(cache_dir, 'facets.json'))
+    os.environ.setdefault('USER_CACHE_STAMP_FILE', os.path.join(cache_dir, 'users.stamp'))
+
+
+def _engines():
+    from app import app, db
+    with app.app_context():
+        return list(db.engines.values())
+
+
+def when_ready(server):
+    # Setup left pooled connections open in the master; close them so no
+    # worker inherits a live socket
+    for engine in _engines():
+        engine.dispose()
+    server.log.info("Serving with %d %s workers x %d threads (%s profile)", workers, worker_class, threads, io_profile)
+
+
+def post_fork(server, worker):
+    # Forget any pooled connections copied from the master without closing
+    # them: the sockets are shared with it, so closing here would break them
+    for engine in _engines():
+        engine.dispose(close=False)
@@ -0,0 +1,20 @@
+import sys
+from app import app, User, import_csv
+
+def run_import(path, username="admin"):
+    print(f"📥 Importing {path} ...")
+
+    with app.app_context():
+        reporter = User.query.filter_by(username=username).first()
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            result = import_csv(f, reporter=reporter, chunk_size=app.config['IMPORT_CHUNK_SIZE'])
+
+    print(f"✅ Imported {result['carcasses']} encounters and {result['samples']} samples.")
+    for line, msg in result['errors']:
+        print(f"⚠️  Line {line}: {msg}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python import_csv.py <file.csv> [username]")
+        sys.exit(1)
+    run_import(*sys.argv[1:3])
@@ -0,0 +1,14 @@
+from app import app, refresh_statistics, refresh_rollups, refresh_road_hotspots
+
+def refresh_stats():
+    with app.app_context():
+        # Rebuilds the dashboard counters and analytics rollups and brings
+        # the road hotspot cache up to date; run after raw SQL edits or from cron
+        refresh_statistics()
+        refresh_rollups()
+        refresh_road_hotspots()
+
+    print("✅ Dashboard statistics, analytics rollups and road hotspots refreshed.")
+
+if __name__ == "__main__":
+    refresh_stats()